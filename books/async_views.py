@@ -0,0 +1,72 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+
+from books.cache import catalog_cache
+from books.models import (
+    Book,
+    detail_last_modified,
+    shard_stock_subquery,
+)
+from books.search import search_books
+from books.serializers import BookSerializer
+from library_service.conditional import async_conditional_get
+
+
+async def get_list_validators(request):
+    # ETag only, like ``BookViewSet.get_list_validators``.
+    etag_source = f"{await catalog_cache.aget_version()}:"
+    return etag_source + request.get_full_path(), None
+
+
+async def get_detail_validators(request, pk):
+    async def get_last_modified():
+        return detail_last_modified(
+            await Book.objects.filter(pk=pk)
+            .values_list("updated_at", "inventory_shards")
+            .afirst()
+        )
+
+    last_modified = await catalog_cache.aget_or_set(
+        f"last-modified:{pk}", get_last_modified
+    )
+    etag_source = f"{await catalog_cache.aget_version()}:"
+    return etag_source + request.get_full_path(), last_modified
+
+
+@require_safe
+@async_conditional_get(get_list_validators)
+async def book_list(request):
+    """Async twin of ``BookViewSet.list``, sharing its cache entries."""
+
+    async def get_data():
+        queryset = Book.objects.annotate(shard_stock=shard_stock_subquery())
+        search = request.GET.get("search", "").strip()
+        if search:
+            queryset = search_books(queryset, search)
+        books = [book async for book in queryset]
+        return list(BookSerializer(books, many=True).data)
+
+    data = await catalog_cache.aget_or_set(
+        f"list:{request.GET.urlencode()}", get_data
+    )
+    return JsonResponse(data, safe=False)
+
+
+@require_safe
+@async_conditional_get(get_detail_validators)
+async def book_detail(request, pk):
+    """Async twin of ``BookViewSet.retrieve``."""
+
+    async def get_data():
+        book = await Book.objects.annotate(
+            shard_stock=shard_stock_subquery()
+        ).aget(pk=pk)
+        return dict(BookSerializer(book).data)
+
+    try:
+        data = await catalog_cache.aget_or_set(f"detail:{pk}", get_data)
+    except Book.DoesNotExist:
+        return JsonResponse(
+            {"detail": "No Book matches the given query."}, status=404
+        )
+    return JsonResponse(data)
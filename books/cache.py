@@ -0,0 +1,210 @@
+import asyncio
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from library_service.replicas import primary_reads
+
+_MISSING = object()
+
+
+class CatalogCache:
+    """Two-tier cache for serialized book catalog reads.
+
+    Lookups go to an in-process LRU first and to the shared Django cache
+    (Redis in docker-compose) second. Every key embeds the current catalog
+    version, so a version bump invalidates both tiers at once without
+    deleting anything. Concurrent misses for the same key are coalesced:
+    threads wait on a striped lock and processes on a short-lived lock key
+    in the shared cache, so a cold cache runs each query only once.
+    """
+
+    version_key = "books:catalog:version"
+    lock_stripes = 64
+    poll_interval = 0.05
+
+    def __init__(self, maxsize, timeout, lock_timeout=5):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self._local = OrderedDict()
+        self._local_lock = threading.Lock()
+        self._fill_locks = [
+            threading.Lock() for _ in range(self.lock_stripes)
+        ]
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ("local_hits", "shared_hits", "misses", "coalesced"), 0
+        )
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            # Seed from the clock so a version key lost to eviction never
+            # brings back entries cached under an older version.
+            cache.add(self.version_key, time.time_ns() // 1000, timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump_version(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            self.get_version()
+
+    def get_or_set(self, key, compute):
+        full_key = f"books:catalog:{self.get_version()}:{key}"
+
+        value = self._local_get(full_key)
+        if value is not _MISSING:
+            self._count("local_hits")
+            return value
+
+        lock = self._fill_locks[zlib.crc32(full_key.encode()) % len(
+            self._fill_locks
+        )]
+        with lock:
+            value = self._local_get(full_key)
+            if value is not _MISSING:
+                self._count("coalesced")
+                return value
+
+            value = cache.get(full_key, _MISSING)
+            if value is not _MISSING:
+                self._count("shared_hits")
+            else:
+                value = self._fill_shared(full_key, compute)
+
+            self._local_set(full_key, value)
+            return value
+
+    async def aget_version(self):
+        version = await cache.aget(self.version_key)
+        if version is None:
+            await cache.aadd(
+                self.version_key, time.time_ns() // 1000, timeout=None
+            )
+            version = await cache.aget(self.version_key)
+        return version
+
+    async def aget_or_set(self, key, compute):
+        """``get_or_set`` for async views; ``compute`` is a coroutine
+        function.
+
+        Entries are shared with the sync path. Misses are coalesced across
+        processes through the shared lock key only: the striped thread
+        locks would block the event loop.
+        """
+        full_key = f"books:catalog:{await self.aget_version()}:{key}"
+
+        value = self._local_get(full_key)
+        if value is not _MISSING:
+            self._count("local_hits")
+            return value
+
+        value = await cache.aget(full_key, _MISSING)
+        if value is not _MISSING:
+            self._count("shared_hits")
+        else:
+            value = await self._afill_shared(full_key, compute)
+
+        self._local_set(full_key, value)
+        return value
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update(
+            local_size=len(self._local),
+            local_maxsize=self.maxsize,
+            version=self.get_version(),
+        )
+        return stats
+
+    def clear_local(self):
+        with self._local_lock:
+            self._local.clear()
+
+    def _fill_shared(self, full_key, compute):
+        lock_key = f"{full_key}:lock"
+        owns_lock = cache.add(lock_key, 1, self.lock_timeout)
+        if not owns_lock:
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                value = cache.get(full_key, _MISSING)
+                if value is not _MISSING:
+                    self._count("coalesced")
+                    return value
+
+        self._count("misses")
+        try:
+            # Never cache a lagging replica under a fresh version.
+            with primary_reads():
+                value = compute()
+            cache.set(full_key, value, self.timeout)
+        finally:
+            if owns_lock:
+                cache.delete(lock_key)
+        return value
+
+    async def _afill_shared(self, full_key, compute):
+        lock_key = f"{full_key}:lock"
+        owns_lock = await cache.aadd(lock_key, 1, self.lock_timeout)
+        if not owns_lock:
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                value = await cache.aget(full_key, _MISSING)
+                if value is not _MISSING:
+                    self._count("coalesced")
+                    return value
+
+        self._count("misses")
+        try:
+            with primary_reads():
+                value = await compute()
+            await cache.aset(full_key, value, self.timeout)
+        finally:
+            if owns_lock:
+                await cache.adelete(lock_key)
+        return value
+
+    def _local_get(self, full_key):
+        with self._local_lock:
+            value = self._local.get(full_key, _MISSING)
+            if value is not _MISSING:
+                self._local.move_to_end(full_key)
+            return value
+
+    def _local_set(self, full_key, value):
+        with self._local_lock:
+            self._local[full_key] = value
+            self._local.move_to_end(full_key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+
+catalog_cache = CatalogCache(
+    maxsize=settings.BOOK_CACHE_LOCAL_SIZE,
+    timeout=settings.BOOK_CACHE_TIMEOUT,
+)
+
+
+def invalidate_catalog():
+    """Bump the catalog version now and again once the transaction commits.
+
+    The second bump evicts anything a concurrent reader cached from the
+    pre-commit state in between.
+    """
+    catalog_cache.bump_version()
+    transaction.on_commit(catalog_cache.bump_version)
@@ -0,0 +1,219 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from books.cache import invalidate_catalog
+from books.models import Book
+
+FIELDS = ("title", "author", "cover", "inventory", "daily_fee")
+
+
+def read_rows(path, file_format):
+    """Yield ``(line_number, row)`` pairs without loading the whole file.
+
+    Rows that cannot be parsed at all are yielded with the error message
+    in place of the row dict.
+    """
+    with open(path, newline="", encoding="utf-8") as source:
+        if file_format == "csv":
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as error:
+                yield line_number, f"Invalid JSON: {error.msg}."
+                continue
+            if not isinstance(row, dict):
+                row = "Expected a JSON object."
+            yield line_number, row
+
+
+def build_book(row):
+    """Turn a raw row into an unsaved ``Book``, or raise ValidationError.
+
+    Uses the model field rules (cover choices, non-negative inventory,
+    daily_fee digits) but skips the unique check on ``title``: clashing
+    titles are what the upsert is for.
+    """
+    if isinstance(row, str):
+        raise ValidationError(row)
+
+    missing = [field for field in FIELDS if row.get(field) in (None, "")]
+    if missing:
+        raise ValidationError(
+            {field: "This field is required." for field in missing}
+        )
+
+    book = Book(**{field: row[field] for field in FIELDS})
+    book.clean_fields()
+    return book
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream books from a CSV or JSONL file and upsert them by title "
+        "in batches. Invalid rows are written to a rejects file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument(
+            "--format",
+            choices=("csv", "jsonl"),
+            help="Input format, guessed from the file extension if omitted.",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--rejects",
+            type=Path,
+            help="Where to write rejected rows as JSONL "
+                 "(default: <path>.rejects.jsonl).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.is_file():
+            raise CommandError(f"{path} does not exist.")
+
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format == "json":
+            file_format = "jsonl"
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError(
+                "Cannot guess the file format, pass --format csv|jsonl."
+            )
+
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        rejects_path = options["rejects"] or path.with_name(
+            f"{path.name}.rejects.jsonl"
+        )
+
+        rows = read_rows(path, file_format)
+        read = imported = rejected = 0
+        # Ids of books whose imported inventory was not applied.
+        self.stock_kept = []
+        started = time.perf_counter()
+
+        with open(rejects_path, "w", encoding="utf-8") as rejects:
+            while batch := list(islice(rows, batch_size)):
+                read += len(batch)
+                books = {}
+                for line_number, row in batch:
+                    try:
+                        book = build_book(row)
+                    except ValidationError as error:
+                        rejected += 1
+                        rejects.write(
+                            json.dumps(
+                                {
+                                    "line": line_number,
+                                    "row": row,
+                                    "errors": getattr(
+                                        error, "message_dict", error.messages
+                                    ),
+                                }
+                            )
+                            + "\n"
+                        )
+                        continue
+                    # A title may only be upserted once per statement, the
+                    # last occurrence in the batch wins.
+                    books[book.title] = book
+
+                imported += self.upsert(list(books.values()))
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{read} rows read, {imported} upserted, "
+                    f"{rejected} rejected ({read / elapsed:.0f} rows/s)"
+                )
+
+        if imported:
+            invalidate_catalog()
+
+        style = self.style.WARNING if rejected else self.style.SUCCESS
+        self.stdout.write(
+            style(
+                f"Imported {imported} books, rejected {rejected} rows "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
+        if rejected:
+            self.stdout.write(f"Rejected rows written to {rejects_path}.")
+        else:
+            rejects_path.unlink()
+        if self.stock_kept:
+            self.stderr.write(
+                self.style.WARNING(
+                    f"Kept the inventory of {len(self.stock_kept)} books "
+                    f"with copies on loan, ids: "
+                    f"{', '.join(map(str, self.stock_kept))}."
+                )
+            )
+
+    def upsert(self, books):
+        """Upsert ``books`` by title.
+
+        The imported inventory only replaces the stock of books without
+        copies on loan, which returns would otherwise put back on top of
+        it. Sharded books get it dealt over their shards.
+        """
+        if not books:
+            return 0
+        with transaction.atomic():
+            # Locking the existing books keeps checkouts from slipping in
+            # between the loan check and the upsert.
+            existing = {
+                title: (pk, shards)
+                for title, pk, shards in Book.objects.select_for_update()
+                .filter(title__in=[book.title for book in books])
+                .values_list("title", "pk", "inventory_shards")
+            }
+            on_loan = set(
+                Book.objects.filter(
+                    title__in=existing,
+                    borrowing__isnull=False,
+                    borrowing__actual_return_date__isnull=True,
+                ).values_list("title", flat=True)
+            )
+            restocked, kept = [], []
+            for book in books:
+                _, shards = existing.get(book.title, (None, 0))
+                if shards or book.title in on_loan:
+                    kept.append(book)
+                else:
+                    restocked.append(book)
+
+            fields = ["author", "cover", "daily_fee", "updated_at"]
+            for batch, update_fields in (
+                (restocked, fields + ["inventory"]),
+                (kept, fields),
+            ):
+                Book.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=["title"],
+                    update_fields=update_fields,
+                )
+            for book in kept:
+                pk, shards = existing[book.title]
+                if book.title in on_loan:
+                    self.stock_kept.append(pk)
+                elif shards:
+                    Book.objects.compact_shards(pk, total=book.inventory)
+        return len(books)
@@ -0,0 +1,247 @@
+import asyncio
+import importlib.util
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from books.models import Book
+
+HOST = "127.0.0.1"
+
+
+def wsgi_command(port):
+    return [
+        sys.executable,
+        str(settings.BASE_DIR / "manage.py"),
+        "runserver",
+        f"{HOST}:{port}",
+        "--noreload",
+    ]
+
+
+def asgi_command(port):
+    return [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "library_service.asgi:application",
+        "--host",
+        HOST,
+        "--port",
+        str(port),
+        "--log-level",
+        "warning",
+        "--no-access-log",
+    ]
+
+
+# Server name: (command factory, catalog list path it serves).
+SERVERS = {
+    "wsgi": (wsgi_command, "/api/books/"),
+    "asgi": (asgi_command, "/api/async/books/"),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def process_status(pid):
+    """Resident memory in KiB and thread count of a process, read from
+    /proc, or ``None`` where there is no /proc.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            fields = dict(
+                line.split(":", 1) for line in status if ":" in line
+            )
+    except OSError:
+        return None
+    return int(fields["VmRSS"].split()[0]), int(fields["Threads"])
+
+
+async def wait_until_ready(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"The server for {url} exited early.")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise CommandError(f"The server for {url} did not start in time.")
+
+
+async def run_load(url, requests, concurrency):
+    """Fire ``requests`` GETs, ``concurrency`` at a time. Returns the
+    elapsed seconds, the latencies of successful requests and the number
+    of failures.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def fetch(client):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get(url)
+            except httpx.TransportError:
+                failures += 1
+                return
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures += 1
+
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(fetch(client) for _ in range(requests)))
+        return time.perf_counter() - started, latencies, failures
+
+
+async def hold_slow_clients(port, path, count, pid, settle=1.0):
+    """Open ``count`` connections that send an incomplete request and
+    stall, like slow mobile clients. Returns how many the server accepted
+    and its memory and thread counts before and while holding them.
+    """
+    before = process_status(pid)
+    semaphore = asyncio.Semaphore(50)
+    writers = []
+
+    async def connect():
+        async with semaphore:
+            try:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(HOST, port), timeout=5
+                )
+            except (OSError, asyncio.TimeoutError):
+                return
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {HOST}\r\n".encode())
+            writers.append(writer)
+
+    await asyncio.gather(*(connect() for _ in range(count)))
+    await asyncio.sleep(settle)
+    during = process_status(pid)
+
+    for writer in writers:
+        writer.close()
+    return len(writers), before, during
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the book list through the WSGI (runserver) and ASGI "
+        "(uvicorn) paths in turn and compare requests/sec and memory per "
+        "held slow-client connection."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--slow-clients",
+            type=int,
+            default=500,
+            help="Stalled connections to hold open for the memory check.",
+        )
+        parser.add_argument(
+            "--books",
+            type=int,
+            default=50,
+            help="Scratch books to add to the catalog for the run.",
+        )
+        parser.add_argument(
+            "--servers",
+            nargs="+",
+            choices=list(SERVERS),
+            default=list(SERVERS),
+        )
+
+    def handle(self, *args, **options):
+        if "asgi" in options["servers"] and not importlib.util.find_spec(
+            "uvicorn"
+        ):
+            raise CommandError("The ASGI benchmark needs uvicorn installed.")
+
+        tag = uuid.uuid4().hex[:8]
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"Serve benchmark {tag} {i}",
+                author="Benchmark",
+                cover=Book.Cover.SOFT,
+                inventory=1,
+                daily_fee=Decimal("0.00"),
+            )
+            for i in range(options["books"])
+        )
+        try:
+            for name in options["servers"]:
+                self.benchmark(name, options)
+        finally:
+            Book.objects.filter(pk__in=[book.pk for book in books]).delete()
+
+    def benchmark(self, name, options):
+        command, path = SERVERS[name]
+        port = free_port()
+        url = f"http://{HOST}:{port}{path}"
+        process = subprocess.Popen(
+            command(port),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            asyncio.run(wait_until_ready(url, process))
+            elapsed, latencies, failures = asyncio.run(
+                run_load(url, options["requests"], options["concurrency"])
+            )
+            held, before, during = asyncio.run(
+                hold_slow_clients(
+                    port, path, options["slow_clients"], process.pid
+                )
+            )
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+        latencies.sort()
+        p50 = statistics.median(latencies) if latencies else 0
+        p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] if (
+            latencies
+        ) else 0
+        self.stdout.write(
+            f"{name} {path}  throughput: "
+            f"{len(latencies) / elapsed:.1f} requests/s  "
+            f"p50: {p50 * 1000:.2f} ms  p99: {p99 * 1000:.2f} ms  "
+            f"failures: {failures}"
+        )
+        if before is None or during is None:
+            self.stdout.write(
+                f"{name} slow clients held: {held}  "
+                "(memory is only measured where /proc is available)"
+            )
+            return
+        per_connection = (during[0] - before[0]) / held if held else 0
+        self.stdout.write(
+            f"{name} slow clients held: {held}/{options['slow_clients']}  "
+            f"memory: {before[0] / 1024:.1f} -> {during[0] / 1024:.1f} MiB "
+            f"({per_connection:.1f} KiB/connection)  "
+            f"threads: {before[1]} -> {during[1]}"
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Spread the stock of a hot book over N inventory shards so "
+        "concurrent checkouts stop queueing on its row, or fold it back "
+        "with --shards 0."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("book_id", type=int)
+        parser.add_argument("--shards", type=int, required=True)
+
+    def handle(self, *args, **options):
+        shards = options["shards"]
+        if not 0 <= shards <= 256:
+            raise CommandError("Use from 0 to 256 shards.")
+        try:
+            total = Book.objects.compact_shards(
+                options["book_id"], shards=shards
+            )
+        except Book.DoesNotExist:
+            raise CommandError(f"Book {options['book_id']} does not exist.")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Book {options['book_id']}: {total} copies over "
+                f"{shards} shards."
+            )
+        )
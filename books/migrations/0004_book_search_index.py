@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-18 17:58
+
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX books_book_search_idx ON books_book USING gin "
+    "(to_tsvector('english', title || ' ' || author))",
+]
+POSTGRES_REVERSE = ["DROP INDEX IF EXISTS books_book_search_idx"]
+
+# SQLite: an external-content FTS5 table over books_book, kept in sync by
+# triggers. Note that migrations which make SQLite remake books_book drop
+# these triggers and must create them again.
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE books_book_fts USING fts5("
+    "title, author, content='books_book', content_rowid='id')",
+    "INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')",
+    "CREATE TRIGGER books_book_fts_ai AFTER INSERT ON books_book BEGIN "
+    "INSERT INTO books_book_fts(rowid, title, author) "
+    "VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER books_book_fts_ad AFTER DELETE ON books_book BEGIN "
+    "INSERT INTO books_book_fts(books_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER books_book_fts_au AFTER UPDATE OF title, author "
+    "ON books_book BEGIN "
+    "INSERT INTO books_book_fts(books_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO books_book_fts(rowid, title, author) "
+    "VALUES (new.id, new.title, new.author); END",
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS books_book_fts_ai",
+    "DROP TRIGGER IF EXISTS books_book_fts_ad",
+    "DROP TRIGGER IF EXISTS books_book_fts_au",
+    "DROP TABLE IF EXISTS books_book_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0003_book_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(
+                {"postgresql": POSTGRES_FORWARD, "sqlite": SQLITE_FORWARD}
+            ),
+            run_for_vendor(
+                {"postgresql": POSTGRES_REVERSE, "sqlite": SQLITE_REVERSE}
+            ),
+        ),
+    ]
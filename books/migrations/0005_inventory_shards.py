@@ -0,0 +1,71 @@
+# Generated by Django 5.2 on 2026-10-18 18:29
+
+from importlib import import_module
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+search_index = import_module("books.migrations.0004_book_search_index")
+
+# Adding the column makes SQLite remake books_book, which drops the FTS
+# triggers, so they are created again (where missing) in both directions.
+SQLITE_TRIGGERS = [
+    statement.replace("CREATE TRIGGER", "CREATE TRIGGER IF NOT EXISTS")
+    for statement in search_index.SQLITE_FORWARD
+    if statement.startswith("CREATE TRIGGER")
+]
+recreate_triggers = search_index.run_for_vendor({"sqlite": SQLITE_TRIGGERS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, recreate_triggers),
+        migrations.AddField(
+            model_name="book",
+            name="inventory_shards",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(recreate_triggers, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="InventoryShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index", models.PositiveSmallIntegerField()),
+                (
+                    "copies",
+                    models.IntegerField(
+                        validators=[django.core.validators.MinValueValidator(0)]
+                    ),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="books.book",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("book", "index"), name="inventory_shard_unique"
+                    )
+                ],
+            },
+        ),
+    ]
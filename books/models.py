@@ -1,5 +1,170 @@
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (
+    Case,
+    F,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.utils import timezone
+
+from books.cache import invalidate_catalog
+
+
+def detail_last_modified(row):
+    """Last-Modified of a book from its ``(updated_at, inventory_shards)``
+    row, None when there is no such book.
+
+    Sharded books get none either: shard claims leave ``updated_at``
+    alone, as bumping it would lock the book row sharding keeps cold, so
+    their stock is only tracked by the catalog version in the ETag.
+    """
+    if row is None:
+        return None
+    updated_at, inventory_shards = row
+    return None if inventory_shards else updated_at
+
+
+def shard_stock_subquery():
+    """Copies left across the inventory shards of the outer book, NULL
+    for books that are not sharded.
+    """
+    return Subquery(
+        InventoryShard.objects.filter(book=OuterRef("pk"))
+        .values("book")
+        .annotate(copies=Sum("copies"))
+        .values("copies")
+    )
+
+
+class BookManager(models.Manager):
+    """Stock changes for plain and sharded books.
+
+    A plain book keeps its copies in ``inventory``. A hot book with
+    ``inventory_shards`` set spreads them over that many
+    ``InventoryShard`` rows, so concurrent checkouts lock different rows
+    instead of queueing on one. Its ``inventory`` then only holds the
+    total as of the last ``compact_shards``. Every method tries the plain
+    UPDATE first, so plain books cost no extra query.
+    """
+
+    def claim_copy(self, book_id):
+        """Take one copy off the shelf, return False if none are left.
+
+        The stock check and the decrement run as one conditional UPDATE,
+        so concurrent checkouts can never oversell a title.
+        """
+        claimed = bool(
+            self.filter(
+                pk=book_id, inventory_shards=0, inventory__gte=1
+            ).update(
+                inventory=F("inventory") - 1, updated_at=timezone.now()
+            )
+        ) or InventoryShard.objects.claim(book_id)
+        if claimed:
+            invalidate_catalog()
+        return claimed
+
+    def claim_copies(self, book_ids):
+        """Take one copy of each book, return how many could be taken.
+
+        Books without stock are skipped, so callers compare the result
+        with ``len(book_ids)`` and roll back on a shortfall.
+        """
+        claimed = self.filter(
+            pk__in=book_ids, inventory_shards=0, inventory__gte=1
+        ).update(inventory=F("inventory") - 1, updated_at=timezone.now())
+        if claimed < len(book_ids):
+            for book_id in self.filter(
+                pk__in=book_ids, inventory_shards__gt=0
+            ).values_list("pk", flat=True):
+                claimed += InventoryShard.objects.claim(book_id)
+        if claimed:
+            invalidate_catalog()
+        return claimed
+
+    def release_copy(self, book_id):
+        """Put one copy back on the shelf."""
+        self.release_copies({book_id: 1})
+
+    def release_copies(self, counts):
+        """Put copies back on several shelves with a single UPDATE.
+
+        ``counts`` maps book ids to the number of copies returned.
+        """
+        if not counts:
+            return
+        released = self.filter(pk__in=counts, inventory_shards=0).update(
+            inventory=F("inventory")
+            + Case(
+                *(
+                    When(pk=book_id, then=Value(count))
+                    for book_id, count in counts.items()
+                ),
+                default=Value(0),
+            ),
+            updated_at=timezone.now(),
+        )
+        if released < len(counts):
+            for book_id in self.filter(
+                pk__in=counts, inventory_shards__gt=0
+            ).values_list("pk", flat=True):
+                InventoryShard.objects.release(book_id, counts[book_id])
+        invalidate_catalog()
+
+    def compact_shards(self, book_id, total=None, shards=None):
+        """Deal the stock of a book evenly over its ``inventory_shards``
+        rows and store the total in ``inventory``. Returns the total.
+
+        The stock is ``total`` when given (a staff edit), otherwise what
+        the shards hold, or ``inventory`` for a book that was not sharded
+        yet. ``shards`` changes the number of shards first; books set back
+        to 0 get their copies folded into ``inventory``. Runs periodically
+        so drained shards get refilled from the full ones.
+        """
+        with transaction.atomic():
+            book = self.select_for_update().get(pk=book_id)
+            if shards is not None:
+                book.inventory_shards = shards
+            shards = list(
+                InventoryShard.objects.select_for_update()
+                .filter(book_id=book_id)
+                .order_by("index")
+            )
+            if total is None:
+                total = (
+                    sum(shard.copies for shard in shards)
+                    if shards
+                    else book.inventory
+                )
+
+            count = book.inventory_shards
+            share, extra = divmod(total, count) if count else (0, 0)
+            existing = {shard.index: shard for shard in shards}
+            InventoryShard.objects.filter(
+                book_id=book_id, index__gte=count
+            ).delete()
+            for index in range(count):
+                copies = share + (index < extra)
+                shard = existing.get(index)
+                if shard is None:
+                    InventoryShard.objects.create(
+                        book_id=book_id, index=index, copies=copies
+                    )
+                elif shard.copies != copies:
+                    InventoryShard.objects.filter(pk=shard.pk).update(
+                        copies=copies
+                    )
+            self.filter(pk=book_id).update(
+                inventory=total,
+                inventory_shards=count,
+                updated_at=timezone.now(),
+            )
+        invalidate_catalog()
+        return total
 
 
 class Book(models.Model):
@@ -13,3 +178,64 @@ class Book(models.Model):
     cover = models.CharField(choices=Cover.choices, max_length=50)
     inventory = models.IntegerField(validators=[MinValueValidator(0)])
     daily_fee = models.DecimalField(max_digits=6, decimal_places=2)  # $USD
+    updated_at = models.DateTimeField(auto_now=True)
+    # Hot titles spread their stock over this many InventoryShard rows;
+    # 0 keeps it all in ``inventory``.
+    inventory_shards = models.PositiveSmallIntegerField(default=0)
+
+    objects = BookManager()
+
+
+class InventoryShardManager(models.Manager):
+
+    def claim(self, book_id):
+        """Take one copy from a random shard with stock left.
+
+        Shards locked by concurrent checkouts are skipped, so a claim
+        only waits when every shard is busy.
+        """
+        stocked = self.filter(book_id=book_id, copies__gte=1).order_by("?")
+        with transaction.atomic(savepoint=False):
+            shard_id = (
+                stocked.select_for_update(skip_locked=True)
+                .values_list("pk", flat=True)
+                .first()
+            )
+            # Every stocked shard is busy: queue on them in turn.
+            for shard_id in (
+                [shard_id]
+                if shard_id
+                else stocked.values_list("pk", flat=True)
+            ):
+                if self.filter(pk=shard_id, copies__gte=1).update(
+                    copies=F("copies") - 1
+                ):
+                    return True
+        return False
+
+    def release(self, book_id, count=1):
+        """Put ``count`` copies back on a random shard."""
+        self.filter(
+            pk=Subquery(
+                self.filter(book_id=book_id).order_by("?").values("pk")[:1]
+            )
+        ).update(copies=F("copies") + count)
+
+
+class InventoryShard(models.Model):
+    """One of the counters holding the stock of a sharded book."""
+
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name="shards"
+    )
+    index = models.PositiveSmallIntegerField()
+    copies = models.IntegerField(validators=[MinValueValidator(0)])
+
+    objects = InventoryShardManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "index"], name="inventory_shard_unique"
+            ),
+        ]
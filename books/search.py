@@ -0,0 +1,57 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+PG_DOCUMENT = (
+    "to_tsvector('english', books_book.title || ' ' || books_book.author)"
+)
+PG_QUERY = "websearch_to_tsquery('english', %s)"
+
+
+def search_books(queryset, query):
+    """Filter ``queryset`` to books matching ``query``, best matches first.
+
+    Uses the full-text index created by ``0004_book_search_index``: a GIN
+    expression index on PostgreSQL and an FTS5 table kept in sync by
+    triggers on SQLite. Other backends fall back to substring matching.
+    """
+    vendor = connections[queryset.db].vendor
+
+    if vendor == "postgresql":
+        return queryset.filter(
+            RawSQL(
+                f"{PG_DOCUMENT} @@ {PG_QUERY}",
+                (query,),
+                output_field=BooleanField(),
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"ts_rank({PG_DOCUMENT}, {PG_QUERY})",
+                (query,),
+                output_field=FloatField(),
+            )
+        ).order_by("-search_rank", "id")
+
+    if vendor == "sqlite":
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return queryset.none()
+        # Quote every term so user input cannot inject FTS5 syntax, and
+        # match prefixes so partially typed words still find the book.
+        match = " ".join(f'"{term}"*' for term in terms)
+        return queryset.extra(
+            tables=["books_book_fts"],
+            where=[
+                "books_book_fts.rowid = books_book.id",
+                "books_book_fts MATCH %s",
+            ],
+            params=[match],
+            select={"search_rank": "books_book_fts.rank"},
+            order_by=["search_rank", "id"],
+        )
+
+    return queryset.filter(
+        Q(title__icontains=query) | Q(author__icontains=query)
+    ).order_by("title")
@@ -1,3 +1,4 @@
+from django.db.models import Sum
 from rest_framework import serializers
 
 from books.models import Book
@@ -15,3 +16,26 @@ class BookSerializer(serializers.ModelSerializer):
             "inventory",
             "daily_fee",
         )
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Sharded books report what their shards hold, annotated by the
+        # catalog querysets with ``shard_stock_subquery`` and looked up
+        # here for books nested elsewhere (borrowing details).
+        shard_stock = getattr(instance, "shard_stock", None)
+        if not hasattr(instance, "shard_stock") and instance.inventory_shards:
+            shard_stock = instance.shards.aggregate(copies=Sum("copies"))[
+                "copies"
+            ]
+        if shard_stock is not None:
+            data["inventory"] = shard_stock
+        return data
+
+    def update(self, instance, validated_data):
+        book = super().update(instance, validated_data)
+        if book.inventory_shards and "inventory" in validated_data:
+            Book.objects.compact_shards(
+                book.pk, total=validated_data["inventory"]
+            )
+            book.shard_stock = None
+        return book
@@ -0,0 +1,21 @@
+from celery import shared_task
+from django.db.models import Q
+
+from books.models import Book
+
+
+@shared_task
+def compact_inventory_shards_task():
+    """Rebalance the shards of every sharded book and refresh its
+    ``inventory`` total. Returns the number of books compacted.
+    """
+    book_ids = list(
+        Book.objects.filter(
+            Q(inventory_shards__gt=0) | Q(shards__isnull=False)
+        )
+        .distinct()
+        .values_list("pk", flat=True)
+    )
+    for book_id in book_ids:
+        Book.objects.compact_shards(book_id)
+    return len(book_ids)
@@ -1,11 +1,101 @@
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
-from books.models import Book
+from books.cache import catalog_cache
+from books.models import (
+    Book,
+    detail_last_modified,
+    shard_stock_subquery,
+)
 from books.permissions import IsAdminOrReadOnly
+from books.search import search_books
 from books.serializers import BookSerializer
+from library_service.conditional import conditional_get
 
 
 class BookViewSet(viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = (IsAdminOrReadOnly, )
+
+    def get_queryset(self):
+        queryset = super().get_queryset().annotate(
+            shard_stock=shard_stock_subquery()
+        )
+
+        search = self.request.query_params.get("search", "").strip()
+        if self.action == "list" and search:
+            queryset = search_books(queryset, search)
+
+        return queryset
+
+    @staticmethod
+    def get_etag_source(request):
+        # Cached representations only change when the catalog version does.
+        return f"{catalog_cache.get_version()}:{request.get_full_path()}"
+
+    def get_list_validators(self, request, *args, **kwargs):
+        # No Last-Modified: the newest updated_at stays put when books
+        # are deleted, while the catalog version in the ETag moves.
+        return self.get_etag_source(request), None
+
+    def get_detail_validators(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+
+        def get_last_modified():
+            try:
+                return detail_last_modified(
+                    Book.objects.filter(pk=pk)
+                    .values_list("updated_at", "inventory_shards")
+                    .first()
+                )
+            except (TypeError, ValueError):
+                return None
+
+        last_modified = catalog_cache.get_or_set(
+            f"last-modified:{pk}", get_last_modified
+        )
+        return self.get_etag_source(request), last_modified
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="search",
+                type=str,
+                description="Full-text search over title and author, "
+                            "best matches first (ex: ?search=tolkien)",
+                required=False,
+            ),
+        ]
+    )
+    @conditional_get("get_list_validators")
+    def list(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_set(
+            f"list:{request.query_params.urlencode()}",
+            lambda: list(super(BookViewSet, self).list(
+                request, *args, **kwargs
+            ).data),
+        )
+        return Response(data)
+
+    @conditional_get("get_detail_validators")
+    def retrieve(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_set(
+            f"detail:{kwargs[self.lookup_field]}",
+            lambda: dict(super(BookViewSet, self).retrieve(
+                request, *args, **kwargs
+            ).data),
+        )
+        return Response(data)
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="cache-stats",
+        permission_classes=(IsAdminUser,),
+    )
+    def cache_stats(self, request):
+        return Response(catalog_cache.stats())
@@ -0,0 +1,60 @@
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from borrowings.models import ArchivedBorrowing, Borrowing
+
+ARCHIVE_FIELDS = (
+    "id",
+    "borrow_date",
+    "expected_return_date",
+    "actual_return_date",
+    "book_id",
+    "user_id",
+    "fine",
+)
+
+
+def archivable(cutoff):
+    """Borrowings returned before ``cutoff`` that the circulation rollups
+    have already counted, read from ``borrowing_returned_idx``.
+    """
+    return Borrowing.objects.filter(
+        actual_return_date__lt=cutoff,
+        rollup_stage=Borrowing.RollupStage.RETURNED,
+    ).order_by("actual_return_date", "id")
+
+
+def archive_borrowings(older_than_days, batch_size, today=None):
+    """Move borrowings returned more than ``older_than_days`` ago into
+    ``ArchivedBorrowing``. Returns the number of borrowings moved.
+
+    Every batch is one short transaction: lock the rows (skipping any a
+    concurrent job holds), copy them and delete them, so no lock outlives
+    ``batch_size`` rows and readers never see a borrowing twice or not
+    at all.
+    """
+    today = today or timezone.now().date()
+    cutoff = today - datetime.timedelta(days=older_than_days)
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                archivable(cutoff)
+                .select_for_update(skip_locked=True)
+                .values(*ARCHIVE_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return archived
+
+            ArchivedBorrowing.objects.bulk_create(
+                ArchivedBorrowing(**row) for row in rows
+            )
+            Borrowing.objects.filter(
+                id__in=[row["id"] for row in rows]
+            ).delete()
+
+        archived += len(rows)
+        if len(rows) < batch_size:
+            return archived
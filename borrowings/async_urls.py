@@ -0,0 +1,7 @@
+from django.urls import path
+
+from borrowings.async_views import borrowing_list
+
+app_name = "async-borrowings"
+
+urlpatterns = [path("", borrowing_list, name="borrowing-list")]
@@ -0,0 +1,73 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from borrowings.models import Borrowing
+from borrowings.pagination import BorrowingCursorPagination
+from borrowings.serializers import (
+    BorrowingAdminSerializer,
+    BorrowingSerializer,
+)
+from borrowings.views import (
+    LIST_STATE,
+    filter_borrowings,
+    list_etag_source,
+    list_state_queryset,
+)
+from library_service.conditional import async_conditional_get
+from users.authentication import api_error_response, jwt_required
+
+
+def get_queryset(request):
+    return filter_borrowings(
+        Borrowing.objects.all(), request.user, request.GET
+    )
+
+
+async def get_list_validators(request):
+    queryset = get_queryset(request)
+    try:
+        page = list_state_queryset(queryset, Request(request))
+    except APIException:
+        # Left to the view to report.
+        return None, None
+    if page is None:
+        state = await queryset.aaggregate(**LIST_STATE)
+    else:
+        state = [row async for row in page]
+    # ETag only, see ``BorrowingViewSet.get_list_validators``.
+    return list_etag_source(request, state), None
+
+
+@require_safe
+@jwt_required
+@async_conditional_get(get_list_validators)
+async def borrowing_list(request):
+    """Async twin of ``BorrowingViewSet.list``, with the same filters
+    and opt-in keyset pagination.
+    """
+    serializer_class = (
+        BorrowingAdminSerializer
+        if request.user.is_staff
+        else BorrowingSerializer
+    )
+    queryset = get_queryset(request)
+    paginator = BorrowingCursorPagination()
+    try:
+        page = paginator.get_page_queryset(queryset, Request(request))
+    except APIException as exc:
+        return api_error_response(exc)
+
+    if page is None:
+        borrowings = [borrowing async for borrowing in queryset]
+        return JsonResponse(
+            serializer_class(borrowings, many=True).data, safe=False
+        )
+
+    page = paginator.set_page([borrowing async for borrowing in page])
+    return JsonResponse(
+        paginator.get_paginated_response(
+            serializer_class(page, many=True).data
+        ).data
+    )
@@ -0,0 +1,107 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import (
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    Func,
+    IntegerField,
+    Max,
+    Min,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest, Round
+from django.utils import timezone
+
+from books.models import Book
+
+ZERO = Decimal("0.00")
+FINE_FIELD = DecimalField(max_digits=10, decimal_places=2)
+
+
+class DaysBetween(Func):
+    """Whole days from the second date expression to the first."""
+
+    arity = 2
+    arg_joiner = " - "
+    template = "(%(expressions)s)"
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template="CAST(JULIANDAY(%(expressions)s) AS INTEGER)",
+            arg_joiner=") - JULIANDAY(",
+            **extra_context,
+        )
+
+
+def calculate_fine(expected_return_date, return_date, daily_fee):
+    """Fine for one borrowing, the Python twin of ``fine_expression``."""
+    overdue_days = max((return_date - expected_return_date).days, 0)
+    return (daily_fee or ZERO) * overdue_days
+
+
+def fine_expression(today, daily_fee=F("book__daily_fee")):
+    """SQL expression for a borrowing's fine as of ``today``.
+
+    Every day past ``expected_return_date`` costs the book's daily fee,
+    counted up to the return date or, while the book is still out, up to
+    ``today``. ``daily_fee`` defaults to a join; UPDATE statements, which
+    cannot join, pass a subquery instead.
+    """
+    overdue_days = Greatest(
+        DaysBetween(
+            Coalesce("actual_return_date", Value(today)),
+            "expected_return_date",
+        ),
+        Value(0),
+    )
+    return Coalesce(
+        Round(
+            ExpressionWrapper(
+                overdue_days * daily_fee, output_field=FINE_FIELD
+            ),
+            precision=2,
+        ),
+        Value(ZERO),
+        output_field=FINE_FIELD,
+    )
+
+
+def daily_fee_subquery():
+    return Subquery(
+        Book.objects.filter(pk=OuterRef("book_id")).values("daily_fee")[:1]
+    )
+
+
+def recompute_fines(queryset, today=None, chunk_size=None):
+    """Bring the stored fine of every overdue, unreturned borrowing in
+    ``queryset`` up to date. Returns the number of rows updated.
+
+    Each chunk is one UPDATE over an id range, so the database does the
+    arithmetic and row locks are held for one chunk at a time.
+    """
+    today = today or timezone.now().date()
+    chunk_size = chunk_size or settings.FINE_RECOMPUTE_CHUNK_SIZE
+    overdue = queryset.filter(
+        actual_return_date__isnull=True, expected_return_date__lt=today
+    )
+    bounds = overdue.aggregate(first=Min("id"), last=Max("id"))
+    if bounds["first"] is None:
+        return 0
+
+    updated = 0
+    now = timezone.now()
+    for start in range(bounds["first"], bounds["last"] + 1, chunk_size):
+        updated += overdue.filter(
+            id__gte=start, id__lt=start + chunk_size
+        ).update(
+            fine=fine_expression(today, daily_fee=daily_fee_subquery()),
+            updated_at=now,
+        )
+    return updated
@@ -0,0 +1,151 @@
+import datetime
+import statistics
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction, DatabaseError
+from django.utils import timezone
+
+from books.models import Book
+from borrowings.models import Borrowing
+
+
+def checkout(book_id, user_id, expected_return_date):
+    """Run one checkout the way the borrowing endpoint does.
+
+    Returns the outcome ("ok", "sold_out" or "error") and the latency.
+    """
+    started = time.perf_counter()
+    try:
+        with transaction.atomic():
+            Borrowing.objects.create(
+                book_id=book_id,
+                user_id=user_id,
+                expected_return_date=expected_return_date,
+            )
+            if not Book.objects.claim_copy(book_id):
+                raise ValidationError("Sold out.")
+        outcome = "ok"
+    except ValidationError:
+        outcome = "sold_out"
+    except DatabaseError:
+        outcome = "error"
+    finally:
+        connections.close_all()
+    return outcome, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire N parallel checkouts at a single scratch book and report "
+        "throughput, latency and whether the inventory invariant held. "
+        "Pass several --shards counts to compare sharded inventories."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checkouts", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--inventory", type=int, default=250)
+        parser.add_argument(
+            "--processes",
+            action="store_true",
+            help="Use worker processes instead of threads.",
+        )
+        parser.add_argument(
+            "--shards",
+            type=int,
+            nargs="+",
+            default=[0],
+            help="Inventory shard counts to run in turn, 0 for a plain "
+                 "book (ex: --shards 0 4 16).",
+        )
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create_user(
+            email=f"stress-{tag}@example.com"
+        )
+        try:
+            for shards in options["shards"]:
+                self.stress(user, shards, f"{tag}-{shards}", options)
+        finally:
+            user.delete()
+
+    def stress(self, user, shards, tag, options):
+        checkouts = options["checkouts"]
+        initial_inventory = options["inventory"]
+
+        book = Book.objects.create(
+            title=f"Checkout stress {tag}",
+            author="Stress Test",
+            cover=Book.Cover.SOFT,
+            inventory=initial_inventory,
+            daily_fee=Decimal("0.00"),
+        )
+        if shards:
+            Book.objects.compact_shards(book.id, shards=shards)
+        due = timezone.now().date() + datetime.timedelta(days=14)
+
+        executor_class = (
+            ProcessPoolExecutor if options["processes"] else ThreadPoolExecutor
+        )
+        # Forked workers must not inherit the parent's open connections.
+        connections.close_all()
+
+        try:
+            started = time.perf_counter()
+            with executor_class(max_workers=options["workers"]) as executor:
+                results = list(
+                    executor.map(
+                        checkout,
+                        [book.id] * checkouts,
+                        [user.id] * checkouts,
+                        [due] * checkouts,
+                    )
+                )
+            elapsed = time.perf_counter() - started
+
+            # Sums the shards into inventory.
+            Book.objects.compact_shards(book.id)
+            book.refresh_from_db()
+            borrowed = Borrowing.objects.filter(book=book).count()
+        finally:
+            book.delete()
+
+        outcomes = [outcome for outcome, _ in results]
+        latencies = sorted(latency for _, latency in results)
+        p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+
+        self.stdout.write(
+            f"shards: {shards}  checkouts: {checkouts}  "
+            f"ok: {outcomes.count('ok')}  "
+            f"sold out: {outcomes.count('sold_out')}  "
+            f"errors: {outcomes.count('error')}"
+        )
+        self.stdout.write(
+            f"throughput: {checkouts / elapsed:.1f} checkouts/s  "
+            f"p50: {statistics.median(latencies) * 1000:.2f} ms  "
+            f"p99: {p99 * 1000:.2f} ms"
+        )
+
+        expected_inventory = initial_inventory - borrowed
+        if (
+            book.inventory != expected_inventory
+            or book.inventory < 0
+            or borrowed != outcomes.count("ok")
+        ):
+            raise CommandError(
+                f"Inventory invariant violated: {initial_inventory} initial, "
+                f"{borrowed} borrowed, {book.inventory} left."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Invariant held: {initial_inventory} initial = "
+                f"{borrowed} borrowed + {book.inventory} left."
+            )
+        )
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 17:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_search_index"),
+        ("borrowings", "0008_borrowing_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="borrowing",
+            name="reminder_sent_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(
+                    ("actual_return_date__isnull", True),
+                    ("reminder_sent_at__isnull", True),
+                ),
+                fields=["expected_return_date", "id"],
+                name="borrowing_reminder_due_idx",
+            ),
+        ),
+    ]
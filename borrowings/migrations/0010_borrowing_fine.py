@@ -0,0 +1,80 @@
+# Generated by Django 5.2 on 2026-10-18 17:53
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import (
+    DecimalField,
+    ExpressionWrapper,
+    Func,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce, Round
+
+ZERO = Decimal("0.00")
+FINE_FIELD = DecimalField(max_digits=10, decimal_places=2)
+
+
+# Frozen copy of ``borrowings.fines.DaysBetween`` and the fine pricing as
+# of this migration, so later changes to the live code cannot alter it.
+class DaysBetween(Func):
+    arity = 2
+    arg_joiner = " - "
+    template = "(%(expressions)s)"
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template="CAST(JULIANDAY(%(expressions)s) AS INTEGER)",
+            arg_joiner=") - JULIANDAY(",
+            **extra_context,
+        )
+
+
+def backfill_fines(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    Borrowing = apps.get_model("borrowings", "Borrowing")
+    daily_fee = Subquery(
+        Book.objects.filter(pk=OuterRef("book_id")).values("daily_fee")[:1]
+    )
+    # Only late returns are priced, so the overdue days are positive.
+    overdue_days = DaysBetween("actual_return_date", "expected_return_date")
+    Borrowing.objects.filter(
+        expected_return_date__lt=models.F("actual_return_date")
+    ).update(
+        fine=Coalesce(
+            Round(
+                ExpressionWrapper(
+                    overdue_days * daily_fee, output_field=FINE_FIELD
+                ),
+                precision=2,
+            ),
+            Value(ZERO),
+            output_field=FINE_FIELD,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_search_index"),
+        ("borrowings", "0009_borrowing_reminder_sent_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="borrowing",
+            name="fine",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=10
+            ),
+        ),
+        # Fines of books returned late are final, price them once here;
+        # the nightly recompute only looks at borrowings still out.
+        migrations.RunPython(backfill_fines, migrations.RunPython.noop),
+    ]
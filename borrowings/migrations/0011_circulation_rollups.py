@@ -0,0 +1,66 @@
+# Generated by Django 5.2 on 2026-10-18 17:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_search_index"),
+        ("borrowings", "0010_borrowing_fine"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookCirculation",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="books.book",
+                    ),
+                ),
+                ("borrowed", models.PositiveIntegerField(default=0)),
+                ("active", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailyCirculation",
+            fields=[
+                ("day", models.DateField(primary_key=True, serialize=False)),
+                ("borrowed", models.PositiveIntegerField(default=0)),
+                ("returned", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="borrowing",
+            name="rollup_stage",
+            field=models.PositiveSmallIntegerField(
+                choices=[(0, "Pending"), (1, "Borrowed"), (2, "Returned")], default=0
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(
+                    ("rollup_stage", 0),
+                    models.Q(
+                        ("actual_return_date__isnull", False), ("rollup_stage", 1)
+                    ),
+                    _connector="OR",
+                ),
+                fields=["id"],
+                name="borrowing_rollup_pending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookcirculation",
+            index=models.Index(fields=["-active"], name="bookcirculation_active_idx"),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-18 19:13
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_author_circulation(apps, schema_editor):
+    # Sum the per-book rollups, which already cover every borrowing.
+    BookCirculation = apps.get_model("borrowings", "BookCirculation")
+    AuthorCirculation = apps.get_model("borrowings", "AuthorCirculation")
+    AuthorCirculation.objects.bulk_create(
+        (
+            AuthorCirculation(author=author, borrowed=borrowed, active=active)
+            for author, borrowed, active in BookCirculation.objects.values_list(
+                "book__author"
+            )
+            .annotate(Sum("borrowed"), Sum("active"))
+            .order_by()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0012_archived_borrowing"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuthorCirculation",
+            fields=[
+                (
+                    "author",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("borrowed", models.PositiveIntegerField(default=0)),
+                ("active", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["-borrowed", "author"], name="authorcirculation_top_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(
+            fill_author_circulation, migrations.RunPython.noop
+        ),
+    ]
@@ -1,33 +1,119 @@
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.utils import timezone
 
 from books.models import Book
+from borrowings.fines import ZERO
+from borrowings.returns import return_borrowings
 
 
 class Borrowing(models.Model):
+
+    class RollupStage(models.IntegerChoices):
+        """How much of this borrowing the circulation rollups include."""
+
+        PENDING = 0
+        BORROWED = 1
+        RETURNED = 2
+
     borrow_date = models.DateField(auto_now_add=True)
     expected_return_date = models.DateField()
     actual_return_date = models.DateField(null=True, blank=True)
     book = models.ForeignKey(Book, on_delete=models.CASCADE, null=True)
-    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    # Final once returned; accrued fines of open borrowings are refreshed
+    # nightly by ``recompute_fines_task``.
+    fine = models.DecimalField(max_digits=10, decimal_places=2, default=ZERO)
+    updated_at = models.DateTimeField(auto_now=True)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
+    rollup_stage = models.PositiveSmallIntegerField(
+        choices=RollupStage.choices, default=RollupStage.PENDING
+    )
+    # Lookups by user are served by the composite index below.
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, db_index=False
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "actual_return_date"],
+                name="borrowing_user_return_idx",
+            ),
+            models.Index(
+                fields=["borrow_date", "id"],
+                condition=models.Q(actual_return_date__isnull=True),
+                name="borrowing_active_idx",
+            ),
+            # Holds only borrowings still waiting for a due-date reminder,
+            # so it shrinks as reminders go out.
+            models.Index(
+                fields=["expected_return_date", "id"],
+                condition=models.Q(
+                    actual_return_date__isnull=True,
+                    reminder_sent_at__isnull=True,
+                ),
+                name="borrowing_reminder_due_idx",
+            ),
+            # Borrowings with a borrow or a return the circulation rollups
+            # have not counted yet; the catch-up job reads nothing else.
+            models.Index(
+                fields=["id"],
+                condition=(
+                    models.Q(rollup_stage=0)
+                    | models.Q(
+                        rollup_stage=1, actual_return_date__isnull=False
+                    )
+                ),
+                name="borrowing_rollup_pending_idx",
+            ),
+            # Returned borrowings not archived yet, oldest first, for the
+            # archival job.
+            models.Index(
+                fields=["actual_return_date", "id"],
+                condition=models.Q(actual_return_date__isnull=False),
+                name="borrowing_returned_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def unchanged_fields(self):
+        """Names of the fields still holding the values they were loaded
+        with, or that were never loaded. Empty for new borrowings.
+        """
+        loaded = getattr(self, "_loaded_values", None)
+        if self._state.adding or loaded is None:
+            return set()
+        return {
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname not in self.__dict__
+            or (
+                field.attname in loaded
+                and loaded[field.attname] == self.__dict__[field.attname]
+            )
+        }
 
     def return_book(self):
         if self.actual_return_date:
             raise ValidationError("This borrowing has already been returned.")
 
-        self.actual_return_date = timezone.now().date()
-
-        self.book.inventory += 1
-        self.book.save()
-        self.save()
+        returned = return_borrowings(Borrowing.objects.filter(pk=self.pk))
+        if not returned:
+            raise ValidationError("This borrowing has already been returned.")
+        self.actual_return_date = returned[0]["actual_return_date"]
+        self.fine = returned[0]["fine"]
 
     @staticmethod
     def validate_borrowing(book, error_to_raise):
         if not book:
             raise error_to_raise({"book": "Book must be provided."})
-        if book.inventory < 1:
+        # Sharded books only know their stock when a shard is claimed.
+        if book.inventory < 1 and not book.inventory_shards:
             raise error_to_raise(
                 {
                     "inventory": (
@@ -39,9 +125,100 @@ class Borrowing(models.Model):
             )
 
     def clean(self):
-        if self.book:
+        # Stock only matters when a copy is being taken; returning or
+        # editing an existing borrowing must work even at zero inventory.
+        if self._state.adding and self.book:
             Borrowing.validate_borrowing(self.book, ValidationError)
 
-    def save(self, *args, **kwargs):
-        self.full_clean()
+    def save(self, *args, validated=False, **kwargs):
+        """Validate the fields that changed since the borrowing was loaded
+        (all of them for a new one), then save.
+
+        Callers that validated the values already, like the serializers,
+        pass ``validated=True`` to skip the model validation and the
+        foreign key lookups it runs.
+        """
+        if not validated:
+            self.full_clean(exclude=self.unchanged_fields())
         super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+
+class ArchivedBorrowing(models.Model):
+    """A borrowing returned long ago, moved out of ``Borrowing`` by
+    ``archive_borrowings`` under its original id.
+
+    Keeping them apart leaves the hot table with open loans and recent
+    returns only. Archived rows are final: they are already counted in
+    the circulation rollups and their fines no longer change.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    borrow_date = models.DateField()
+    expected_return_date = models.DateField()
+    actual_return_date = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, null=True)
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, db_index=False
+    )
+    fine = models.DecimalField(max_digits=10, decimal_places=2, default=ZERO)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "borrow_date", "id"],
+                name="archived_user_history_idx",
+            ),
+            models.Index(
+                fields=["borrow_date", "id"],
+                name="archived_history_idx",
+            ),
+        ]
+
+
+class DailyCirculation(models.Model):
+    """Borrows and returns per calendar day."""
+
+    day = models.DateField(primary_key=True)
+    borrowed = models.PositiveIntegerField(default=0)
+    returned = models.PositiveIntegerField(default=0)
+
+
+class BookCirculation(models.Model):
+    """All-time borrows and currently active loans per book."""
+
+    book = models.OneToOneField(
+        Book, on_delete=models.CASCADE, primary_key=True
+    )
+    borrowed = models.PositiveIntegerField(default=0)
+    active = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-active"], name="bookcirculation_active_idx"
+            ),
+        ]
+
+
+class AuthorCirculation(models.Model):
+    """All-time borrows and currently active loans per author, counted
+    under the book's author at the time of each event.
+    """
+
+    author = models.CharField(max_length=255, primary_key=True)
+    borrowed = models.PositiveIntegerField(default=0)
+    active = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-borrowed", "author"],
+                name="authorcirculation_top_idx",
+            ),
+        ]
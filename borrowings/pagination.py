@@ -0,0 +1,134 @@
+import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor
+
+
+class BorrowingCursorPagination(CursorPagination):
+    """Opt-in keyset pagination over ``(borrow_date, id)``.
+
+    Pagination kicks in only when the client sends ``page_size`` or
+    ``cursor``; plain requests keep receiving the unpaginated list.
+    Unlike the stock ``CursorPagination`` the cursor stores the full
+    ``(borrow_date, id)`` key, so every page is a single range scan
+    no matter how many borrowings share the same date.
+    """
+
+    ordering = ("borrow_date", "id")
+    default_page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        if (
+            self.page_size_query_param not in request.query_params
+            and self.cursor_query_param not in request.query_params
+        ):
+            return None
+        return super().get_page_size(request) or self.default_page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    def get_page_queryset(self, queryset, request):
+        """Read the page from the request and return the queryset of its
+        rows plus one look-ahead row, or ``None`` when not paginating.
+
+        Async views evaluate it themselves and pass the rows to
+        ``set_page``.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        if reverse:
+            queryset = queryset.order_by("-borrow_date", "-id")
+        else:
+            queryset = queryset.order_by("borrow_date", "id")
+
+        if self.cursor is not None:
+            borrow_date, pk = self.cursor.position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(borrow_date__lt=borrow_date)
+                    | Q(borrow_date=borrow_date, id__lt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(borrow_date__gt=borrow_date)
+                    | Q(borrow_date=borrow_date, id__gt=pk)
+                )
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.cursor and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=position)
+        )
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+
+        try:
+            borrow_date, pk = cursor.position.split("|")
+            position = (datetime.date.fromisoformat(borrow_date), int(pk))
+        except (AttributeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        borrow_date, pk = cursor.position
+        return super().encode_cursor(
+            cursor._replace(position=f"{borrow_date.isoformat()}|{pk}")
+        )
+
+    def _get_position_from_instance(self, instance, ordering=None):
+        if isinstance(instance, dict):
+            return instance["borrow_date"], instance["id"]
+        return instance.borrow_date, instance.id
@@ -0,0 +1,67 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from books.models import Book
+from borrowings.fines import daily_fee_subquery, fine_expression
+
+RETURNED_FIELDS = ("id", "book_id", "actual_return_date", "fine")
+
+
+def update_returning(queryset, values, fields):
+    """``queryset.update(**values)`` that returns the updated rows as
+    dicts of ``fields``. Must run inside a transaction.
+
+    The matching rows are locked, updated only where they still match
+    ``queryset`` and read back. ``values`` must set ``updated_at``: where
+    the database cannot lock rows (SQLite), a concurrent update may win
+    between the read and the update, and the rows it took are told apart
+    by the timestamp this call wrote.
+    """
+    model = queryset.model
+    ids = list(queryset.select_for_update().values_list("pk", flat=True))
+    if not ids:
+        return []
+    queryset.filter(pk__in=ids).update(**values)
+    return list(
+        model.objects.filter(
+            pk__in=ids, updated_at=values["updated_at"]
+        ).values(*fields)
+    )
+
+
+def return_borrowings(queryset, today=None):
+    """Return the borrowings of ``queryset`` that are still open and put
+    their copies back on the shelves. Returns the returned borrowings as
+    dicts of ``RETURNED_FIELDS``.
+
+    The open borrowings are locked, and the return date is only set
+    where it is still empty, in the same statement that prices the final
+    fine. Two concurrent returns of one borrowing can never both succeed:
+    the loser finds the borrowing returned once the winner commits, and
+    leaves it out of the result.
+    """
+    today = today or timezone.now().date()
+    with transaction.atomic():
+        returned = update_returning(
+            queryset.filter(actual_return_date__isnull=True),
+            {
+                "actual_return_date": today,
+                # SET clauses see the old, still empty return date, so
+                # the fine is counted up to today.
+                "fine": fine_expression(
+                    today, daily_fee=daily_fee_subquery()
+                ),
+                "updated_at": timezone.now(),
+            },
+            RETURNED_FIELDS,
+        )
+        Book.objects.release_copies(
+            Counter(
+                row["book_id"]
+                for row in returned
+                if row["book_id"] is not None
+            )
+        )
+    return returned
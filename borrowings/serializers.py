@@ -1,18 +1,24 @@
 from django.db import transaction
-from django.utils import timezone
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 
+from books.models import Book, shard_stock_subquery
 from books.serializers import BookSerializer
 from borrowings.models import Borrowing
-from notifications.tasks import send_telegram_message_task
+from borrowings.returns import return_borrowings
+from notifications.tasks import notify
 
 
+MAX_BASKET_SIZE = 20
+MAX_BULK_RETURN_SIZE = 500
+
 DEFAULT_FIELDS = (
     "id",
     "borrow_date",
     "expected_return_date",
     "actual_return_date",
     "book",
+    "fine",
 )
 
 
@@ -20,13 +26,14 @@ class BaseUserBorrowingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Borrowing
         fields = DEFAULT_FIELDS
-        read_only_fields = ("id", "borrow_date", "actual_return_date")
+        read_only_fields = ("id", "borrow_date", "actual_return_date", "fine")
 
 
 class BaseAdminBorrowingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Borrowing
         fields = DEFAULT_FIELDS + ("user",)
+        read_only_fields = ("fine",)
 
 
 class BorrowingSerializer(BaseUserBorrowingSerializer):
@@ -43,14 +50,22 @@ class BorrowingCreateSerializer(BorrowingSerializer):
         return data
 
     def create(self, validated_data):
+        book = validated_data["book"]
+        # Assign by id: request.user answers id and email from the auth
+        # cache, while assigning the object itself would load the row.
+        user = validated_data.pop("user")
+        validated_data["user_id"] = user.id
         with transaction.atomic():
-            borrowing = super().create(validated_data)
-            book = validated_data["book"]
-            book.inventory -= 1
-            book.save()
+            borrowing = Borrowing(**validated_data)
+            # The serializer fields checked the values and ``validate``
+            # the stock, no need for the model to repeat it.
+            borrowing.save(validated=True)
+            if not Book.objects.claim_copy(book.id):
+                raise serializers.ValidationError(
+                    {"inventory": "No copies of this book are available."}
+                )
 
-            user = borrowing.user
-            send_telegram_message_task.delay(
+            notify(
                 f"📚 <b>New Borrowing Created</b>\n"
                 f"👤 <b>User:</b> ({user.email})\n"
                 f"📖 <b>Book:</b> {book.title}\n"
@@ -60,6 +75,89 @@ class BorrowingCreateSerializer(BorrowingSerializer):
             return borrowing
 
 
+class BasketSoldOut(Exception):
+    """A concurrent checkout took the last copy of a basket book."""
+
+
+class BorrowingCheckoutSerializer(serializers.Serializer):
+    books = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=MAX_BASKET_SIZE,
+    )
+    expected_return_date = serializers.DateField()
+
+    def validate_books(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError(
+                "Each book can only be borrowed once per checkout."
+            )
+        return value
+
+    def create(self, validated_data):
+        book_ids = validated_data["books"]
+        user = validated_data["user"]
+
+        books = Book.objects.in_bulk(book_ids)
+        errors = {}
+        for book_id in book_ids:
+            if book_id not in books:
+                errors[str(book_id)] = "Book not found."
+            elif (
+                books[book_id].inventory < 1
+                and not books[book_id].inventory_shards
+            ):
+                errors[str(book_id)] = "No copies of this book are available."
+        if errors:
+            raise serializers.ValidationError({"books": errors})
+
+        try:
+            with transaction.atomic():
+                if Book.objects.claim_copies(book_ids) != len(book_ids):
+                    raise BasketSoldOut
+                borrowings = Borrowing.objects.bulk_create(
+                    Borrowing(
+                        book_id=book_id,
+                        user_id=user.id,
+                        expected_return_date=validated_data[
+                            "expected_return_date"
+                        ],
+                    )
+                    for book_id in book_ids
+                )
+
+                titles = "\n".join(
+                    f"• {books[book_id].title}" for book_id in book_ids
+                )
+                notify(
+                    f"🧺 <b>New Checkout ({len(borrowings)} books)</b>\n"
+                    f"👤 <b>User:</b> ({user.email})\n"
+                    f"📖 <b>Books:</b>\n{titles}\n"
+                    f"📅 <b>Return by:</b> "
+                    f"{validated_data['expected_return_date']}"
+                )
+                return borrowings
+        except BasketSoldOut:
+            # Sharded books keep their stock in the shards.
+            sold_out = (
+                Book.objects.filter(pk__in=book_ids)
+                .annotate(
+                    stock=Coalesce(shard_stock_subquery(), "inventory")
+                )
+                .filter(stock__lt=1)
+                .values_list("id", flat=True)
+            )
+            raise serializers.ValidationError(
+                {
+                    "books": {
+                        str(book_id): "No copies of this book are available."
+                        for book_id in sold_out
+                    }
+                    or "Stock changed during checkout, please retry."
+                }
+            )
+
+
 class BorrowingDetailSerializer(BorrowingSerializer):
     book = BookSerializer(read_only=True)
 
@@ -75,21 +173,101 @@ class BorrowingAdminDetailSerializer(BorrowingAdminSerializer):
 class BorrowingReturnSerializer(serializers.ModelSerializer):
     class Meta:
         model = Borrowing
-        fields = ("id", "actual_return_date")
-        read_only_fields = ("id", "actual_return_date")
+        fields = ("id", "actual_return_date", "fine")
+        read_only_fields = ("id", "actual_return_date", "fine")
 
-    def validate(self, attrs):
-        if self.instance.actual_return_date:
-            raise serializers.ValidationError(
-                "This borrowing has already been returned."
-            )
-        return attrs
+
+class BorrowingBulkReturnSerializer(serializers.Serializer):
+    borrowings = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=MAX_BULK_RETURN_SIZE,
+    )
 
     def save(self, **kwargs):
-        borrowing = self.instance
-        with transaction.atomic():
-            borrowing.actual_return_date = timezone.now().date()
-            borrowing.book.inventory += 1
-            borrowing.book.save()
-            borrowing.save()
-            return borrowing
+        """Return every open borrowing and report the outcome per id.
+
+        Runs four statements whatever the batch size (see
+        ``return_borrowings``), plus one read that tells apart the ids
+        which were already returned from the missing ones.
+        """
+        ids = list(dict.fromkeys(self.validated_data["borrowings"]))
+
+        returned = {
+            row["id"]
+            for row in return_borrowings(Borrowing.objects.filter(pk__in=ids))
+        }
+        rest = [pk for pk in ids if pk not in returned]
+        existing = set(
+            Borrowing.objects.filter(pk__in=rest).values_list("id", flat=True)
+            if rest
+            else ()
+        )
+        return [
+            {
+                "id": pk,
+                "status": (
+                    "returned" if pk in returned
+                    else "already_returned" if pk in existing
+                    else "not_found"
+                ),
+            }
+            for pk in ids
+        ]
+
+
+class FineBalanceSerializer(serializers.Serializer):
+    outstanding = serializers.DecimalField(
+        max_digits=12, decimal_places=2, read_only=True
+    )
+    fined_borrowings = serializers.IntegerField(read_only=True)
+
+
+class FineReportRowSerializer(FineBalanceSerializer):
+    user_id = serializers.IntegerField(read_only=True)
+    email = serializers.EmailField(read_only=True)
+
+
+class FineReportSerializer(serializers.Serializer):
+    outstanding = serializers.DecimalField(
+        max_digits=14, decimal_places=2, read_only=True
+    )
+    users = FineReportRowSerializer(many=True, read_only=True)
+
+
+class BorrowingHistorySerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    book = serializers.IntegerField(source="book_id", read_only=True)
+    user = serializers.IntegerField(source="user_id", read_only=True)
+    borrow_date = serializers.DateField(read_only=True)
+    expected_return_date = serializers.DateField(read_only=True)
+    actual_return_date = serializers.DateField(read_only=True)
+    fine = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
+    archived = serializers.BooleanField(read_only=True)
+
+
+class CirculationDaySerializer(serializers.Serializer):
+    day = serializers.DateField(read_only=True)
+    borrowed = serializers.IntegerField(read_only=True)
+    returned = serializers.IntegerField(read_only=True)
+
+
+class CirculationBookSerializer(serializers.Serializer):
+    book = serializers.IntegerField(source="book_id", read_only=True)
+    title = serializers.CharField(source="book.title", read_only=True)
+    borrowed = serializers.IntegerField(read_only=True)
+    active = serializers.IntegerField(read_only=True)
+
+
+class CirculationAuthorSerializer(serializers.Serializer):
+    author = serializers.CharField(read_only=True)
+    borrowed = serializers.IntegerField(read_only=True)
+    active = serializers.IntegerField(read_only=True)
+
+
+class CirculationAnalyticsSerializer(serializers.Serializer):
+    daily = CirculationDaySerializer(many=True, read_only=True)
+    books = CirculationBookSerializer(many=True, read_only=True)
+    authors = CirculationAuthorSerializer(many=True, read_only=True)
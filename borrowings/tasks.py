@@ -0,0 +1,96 @@
+import datetime
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from borrowings.archive import archive_borrowings
+from borrowings.fines import recompute_fines
+from borrowings.models import Borrowing
+from borrowings.rollups import catch_up_rollups
+from notifications.tasks import notify_many
+
+
+def due_for_reminder(due_by):
+    """Active borrowings due by ``due_by`` that have not been reminded.
+
+    Only rows in the ``borrowing_reminder_due_idx`` partial index match,
+    so the cost follows the number of reminders, not the table size.
+    """
+    return Borrowing.objects.filter(
+        actual_return_date__isnull=True,
+        reminder_sent_at__isnull=True,
+        expected_return_date__lte=due_by,
+    ).order_by("expected_return_date", "id")
+
+
+def claim_due_reminders(due_by, batch_size):
+    """Mark the next batch of due borrowings as reminded and queue their
+    reminders, all in one transaction.
+
+    A borrowing leaves the bucket as soon as its reminder is queued, which
+    is what makes every reminder go out exactly once.
+    """
+    with transaction.atomic():
+        due = list(
+            due_for_reminder(due_by)
+            .select_for_update(skip_locked=True, of=("self",))
+            .values_list(
+                "id", "expected_return_date", "user__email", "book__title"
+            )[:batch_size]
+        )
+        if not due:
+            return 0
+
+        Borrowing.objects.filter(id__in=[row[0] for row in due]).update(
+            reminder_sent_at=timezone.now()
+        )
+        notify_many(
+            f"⏰ <b>Return Reminder</b>\n"
+            f"👤 <b>User:</b> ({email})\n"
+            f"📖 <b>Book:</b> {title}\n"
+            f"📅 <b>Return by:</b> {expected_return_date}"
+            for _, expected_return_date, email, title in due
+        )
+    return len(due)
+
+
+@shared_task
+def recompute_fines_task():
+    """Refresh the accrued fines of all overdue, unreturned borrowings."""
+    return recompute_fines(Borrowing.objects.all())
+
+
+@shared_task
+def update_circulation_rollups_task():
+    """Fold new borrows and returns into the circulation rollups."""
+    return catch_up_rollups(settings.CIRCULATION_ROLLUP_BATCH_SIZE)
+
+
+@shared_task
+def archive_borrowings_task():
+    """Move borrowings returned more than ``BORROWING_ARCHIVE_AFTER_DAYS``
+    days ago into the archive table.
+    """
+    return archive_borrowings(
+        settings.BORROWING_ARCHIVE_AFTER_DAYS,
+        settings.BORROWING_ARCHIVE_BATCH_SIZE,
+    )
+
+
+@shared_task
+def send_due_reminders_task():
+    """Queue reminders for active borrowings due within
+    ``BORROWING_REMINDER_DAYS`` days, return how many were queued.
+    """
+    due_by = timezone.now().date() + datetime.timedelta(
+        days=settings.BORROWING_REMINDER_DAYS
+    )
+    batch_size = settings.BORROWING_REMINDER_BATCH_SIZE
+    sent = 0
+    while True:
+        claimed = claim_due_reminders(due_by, batch_size)
+        sent += claimed
+        if claimed < batch_size:
+            return sent
@@ -1,18 +1,44 @@
+import csv
+import datetime
+import json
+import re
 from decimal import Decimal
 from unittest.mock import patch
 
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from rest_framework.request import Request
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 
-from books.models import Book
-from borrowings.models import Borrowing
+from books.models import Book, InventoryShard
+from borrowings.archive import archive_borrowings
+from borrowings.models import (
+    ArchivedBorrowing,
+    AuthorCirculation,
+    BookCirculation,
+    Borrowing,
+    DailyCirculation,
+)
+from borrowings.returns import return_borrowings
+from borrowings.rollups import catch_up_rollups, rebuild_rollups
+from borrowings.tasks import (
+    due_for_reminder,
+    recompute_fines_task,
+    send_due_reminders_task,
+)
+from borrowings.views import BorrowingViewSet
+from notifications.models import OutboxMessage
+from users.authentication import get_user_state
 
 
-@patch("notifications.tasks.send_telegram_message_task.delay")
 class BorrowingTests(TestCase):
     def setUp(self):
         User = get_user_model()
@@ -72,7 +98,7 @@ class BorrowingTests(TestCase):
             "borrowings:borrowing-detail", args=[self.borrowing1.id]
         )
 
-    def test_auth_required(self, mock_delay):
+    def test_auth_required(self):
         list_response = self.client.get(self.list_url)
 
         detail_response = self.client.get(self.detail_url)
@@ -88,7 +114,7 @@ class BorrowingTests(TestCase):
         for response in (list_response, detail_response, create_response):
             self.assertEqual(response.status_code, 401)
 
-    def test_non_staff_can_see_only_their_borrowings(self, mock_delay):
+    def test_non_staff_can_see_only_their_borrowings(self):
 
         response = self.user_client1.get(self.list_url)
         self.assertEqual(response.status_code, 200)
@@ -103,7 +129,7 @@ class BorrowingTests(TestCase):
         detail_response = self.user_client1.get(other_detail_url)
         self.assertEqual(detail_response.status_code, 404)
 
-    def test_staff_can_see_all_borrowings(self, mock_delay):
+    def test_staff_can_see_all_borrowings(self):
         response = self.admin_client.get(self.list_url)
         self.assertEqual(response.status_code, 200)
 
@@ -112,7 +138,7 @@ class BorrowingTests(TestCase):
         self.assertIn(self.borrowing1.id, ids)
         self.assertIn(self.borrowing2.id, ids)
 
-    def test_staff_can_filter_by_user_id(self, mock_delay):
+    def test_staff_can_filter_by_user_id(self):
         response = self.admin_client.get(
             self.list_url, {"user_id": self.user1.id}
         )
@@ -125,7 +151,7 @@ class BorrowingTests(TestCase):
             {item["id"] for item in filtered}, {self.borrowing1.id}
         )
 
-    def test_is_active_filtering(self, mock_delay):
+    def test_is_active_filtering(self):
         self.borrowing1.actual_return_date = timezone.now().date()
         self.borrowing1.save()
 
@@ -140,7 +166,7 @@ class BorrowingTests(TestCase):
             borrowing_obj = Borrowing.objects.get(id=item["id"])
             self.assertIsNone(borrowing_obj.actual_return_date)
 
-    def test_borrowings_decrease_book_inventory(self, mock_delay):
+    def test_borrowings_decrease_book_inventory(self):
         inventory = self.book.inventory
         borrowing_data = {
             "book": self.book.id,
@@ -160,10 +186,11 @@ class BorrowingTests(TestCase):
 
         self.book.refresh_from_db()
         self.assertEqual(self.book.inventory, inventory - 1)
+        notification = OutboxMessage.objects.get()
+        self.assertIn(self.book.title, notification.text)
+        self.assertIn(self.user1.email, notification.text)
 
-    def test_cannot_create_borrowing_when_book_inventory_equal_to_0(
-        self, mock_delay
-    ):
+    def test_cannot_create_borrowing_when_book_inventory_equal_to_0(self):
         self.book.inventory = 0
         self.book.save()
         borrowing_data = {
@@ -178,8 +205,88 @@ class BorrowingTests(TestCase):
         self.assertEqual(response.status_code, 400)
         error = response.json()
         self.assertIn("inventory", error)
+        self.assertFalse(OutboxMessage.objects.exists())
 
-    def test_return_borrowing_endpoint(self, mock_delay):
+    def test_model_saves_validate_only_changed_fields(self):
+        borrowing = Borrowing.objects.get(id=self.borrowing1.id)
+        borrowing.expected_return_date += datetime.timedelta(days=7)
+        with self.assertNumQueries(1):  # no FK lookups, just the UPDATE
+            borrowing.save()
+
+        borrowing.user_id = 0
+        with self.assertRaises(ValidationError) as raised:
+            borrowing.save()
+        self.assertEqual(list(raised.exception.error_dict), ["user"])
+
+        self.book.inventory = 0
+        self.book.save()
+        with self.assertRaises(ValidationError):
+            Borrowing.objects.create(
+                book=self.book,
+                user=self.user1,
+                expected_return_date=timezone.now().date(),
+            )
+
+    def test_stale_return_loses_without_releasing_a_copy(self):
+        borrowing = Borrowing.objects.create(
+            book=self.book,
+            user=self.user1,
+            expected_return_date=timezone.now().date(),
+        )
+        inventory = Book.objects.get(id=self.book.id).inventory
+        stale = Borrowing.objects.get(id=borrowing.id)
+
+        borrowing.return_book()
+        self.assertEqual(borrowing.fine, Decimal("0.00"))
+        with self.assertRaises(ValidationError):
+            stale.return_book()
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, inventory + 1)
+
+    def test_return_that_loses_the_update_is_left_out(self):
+        # Where rows cannot be locked (SQLite), a concurrent return can
+        # commit between the read and the update.
+        update = QuerySet.update
+        concurrent = [
+            (
+                Borrowing.objects.filter(pk=self.borrowing1.pk),
+                {"actual_return_date": timezone.now().date()},
+            )
+        ]
+
+        def returned_first(queryset, **values):
+            while concurrent:
+                other, other_values = concurrent.pop()
+                update(other, **other_values)
+            return update(queryset, **values)
+
+        with patch.object(QuerySet, "update", returned_first):
+            returned = return_borrowings(
+                Borrowing.objects.filter(
+                    pk__in=[self.borrowing1.pk, self.borrowing2.pk]
+                )
+            )
+        self.assertEqual([row["id"] for row in returned], [self.borrowing2.pk])
+
+    def test_detail_reports_the_stock_of_a_sharded_book(self):
+        Book.objects.compact_shards(self.book.id, shards=4)
+        for _ in range(2):
+            Book.objects.claim_copy(self.book.id)
+
+        response = self.user_client1.get(self.detail_url)
+        self.assertEqual(response.json()["book"]["inventory"], 8)
+        self.assertNotIn("Last-Modified", response)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.claim_copy(self.book.id)
+        response = self.user_client1.get(
+            self.detail_url, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["book"]["inventory"], 7)
+
+    def test_return_borrowing_endpoint(self):
         self.assertIsNone(self.borrowing1.actual_return_date)
         inventory = self.borrowing1.book.inventory
 
@@ -204,3 +311,1212 @@ class BorrowingTests(TestCase):
         )
         response = self.user_client1.post(return_url, {})
         self.assertNotEqual(response.status_code, 200)
+
+    def test_cursor_pagination_is_opt_in_and_keyset_ordered(self):
+        extra = [
+            Borrowing.objects.create(
+                book=self.book,
+                user=self.user1,
+                expected_return_date=timezone.now().date(),
+            )
+            for _ in range(3)
+        ]
+        Borrowing.objects.filter(id=extra[0].id).update(
+            borrow_date=timezone.now().date() - timezone.timedelta(days=3)
+        )
+
+        response = self.admin_client.get(self.list_url)
+        self.assertIsInstance(response.json(), list)
+
+        expected = list(
+            Borrowing.objects.filter(user=self.user1)
+            .order_by("borrow_date", "id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(expected[0], extra[0].id)
+
+        seen = []
+        url, params = self.list_url, {"user_id": self.user1.id, "page_size": 2}
+        while url:
+            page = self.admin_client.get(url, params).json()
+            seen.extend(item["id"] for item in page["results"])
+            url, params = page["next"], None
+        self.assertEqual(seen, expected)
+
+        previous_page = self.admin_client.get(page["previous"]).json()
+        self.assertEqual(
+            [item["id"] for item in previous_page["results"]], expected[:2]
+        )
+        self.assertIsNone(previous_page["previous"])
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.user_client1.get(self.list_url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_return_works_when_book_is_out_of_stock(self):
+        Book.objects.filter(id=self.book.id).update(inventory=0)
+        return_url = reverse(
+            "borrowings:borrowing-return-borrowing", args=[self.borrowing1.id]
+        )
+
+        response = self.user_client1.post(return_url, {})
+        self.assertEqual(response.status_code, 200)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 1)
+
+
+class BorrowingQueryPlanTests(TestCase):
+    """List queries for the supported filters must be served by an index."""
+
+    SEQUENTIAL_SCAN = {
+        "sqlite": re.compile(r"SCAN borrowings_borrowing(?! USING)"),
+        "postgresql": re.compile(r"Seq Scan on borrowings_borrowing"),
+    }
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin_user = User.objects.create_user(
+            email="admin@admin.com", password="<PASSWORD>", is_staff=True
+        )
+        self.user = User.objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        book = Book.objects.create(
+            title="Plan Book",
+            author="Test Author",
+            cover="HARD",
+            inventory=10,
+            daily_fee=Decimal("1.00"),
+        )
+        for _ in range(3):
+            Borrowing.objects.create(
+                book=book,
+                user=self.user,
+                expected_return_date=timezone.now().date(),
+            )
+
+        if connection.vendor == "postgresql":
+            # Tiny test tables always favour a sequential scan; disable it
+            # so the plan shows whether a usable index exists at all.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def get_plan(self, user, params):
+        request = Request(APIRequestFactory().get("/", params))
+        request.user = user
+        view = BorrowingViewSet(
+            request=request, action="list", format_kwarg=None, kwargs={}
+        )
+        queryset = view.get_queryset().order_by("borrow_date", "id")
+        return queryset.explain()
+
+    def assertIndexed(self, user, params):
+        pattern = self.SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f"No plan check for {connection.vendor}.")
+        plan = self.get_plan(user, params)
+        self.assertIsNone(
+            pattern.search(plan), f"Sequential scan for {params}:\n{plan}"
+        )
+
+    def test_user_list_queries_use_index(self):
+        for params in ({}, {"is_active": "true"}, {"is_active": "false"}):
+            with self.subTest(params=params):
+                self.assertIndexed(self.user, params)
+
+    def test_staff_filtered_list_queries_use_index(self):
+        for params in (
+            {"user_id": self.user.id},
+            {"user_id": self.user.id, "is_active": "true"},
+            {"is_active": "true"},
+        ):
+            with self.subTest(params=params):
+                self.assertIndexed(self.admin_user, params)
+
+    def test_reminder_bucket_query_uses_index(self):
+        pattern = self.SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f"No plan check for {connection.vendor}.")
+        plan = due_for_reminder(timezone.now().date()).explain()
+        self.assertIsNone(pattern.search(plan), plan)
+
+
+# SQL statements per request, including the SAVEPOINT/RELEASE pair that
+# TestCase wraps around atomic blocks (BEGIN/COMMIT in production are not
+# counted). Authentication is answered from the user state cache, which
+# the tests warm up first, and reads spend one query on the validators
+# (ETag, plus Last-Modified on details), which is all a 304 costs.
+BORROWING_QUERY_BUDGETS = {
+    ("list", "user"): 2,
+    ("list", "staff"): 2,
+    ("retrieve", "user"): 2,  # book is joined, not fetched separately
+    ("retrieve", "staff"): 2,
+    ("not_modified", "user"): 1,
+    # book, savepoint, insert, conditional inventory decrement, outbox
+    # insert, release; the serializer already validated the borrowing
+    ("create", "user"): 6,
+    # savepoint, locked read, guarded update, read back, inventory,
+    # release
+    ("return", "user"): 6,
+    # books, savepoint, claim, bulk insert, outbox insert, release
+    ("checkout", "user"): 6,
+    # savepoint, locked read, guarded update, read back, inventory,
+    # release
+    ("bulk_return", "staff"): 6,
+    # one streamed read
+    ("export", "staff"): 1,
+    # one aggregate per table, hot and archived
+    ("balance", "user"): 2,
+    ("fines_report", "staff"): 2,
+    ("history", "staff"): 1,
+    ("history", "staff", "archived"): 2,
+    # daily rollup, top books, top authors
+    ("analytics", "staff"): 3,
+    ("async_list", "user"): 2,
+    ("async_list", "staff"): 2,
+}
+
+
+class BorrowingQueryBudgetTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin_user = User.objects.create_user(
+            email="admin@admin.com", password="<PASSWORD>", is_staff=True
+        )
+        self.user = User.objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        self.clients = {}
+        for role, user in (("staff", self.admin_user), ("user", self.user)):
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION="Bearer "
+                + str(RefreshToken.for_user(user).access_token)
+            )
+            get_user_state(user.id)
+            self.clients[role] = client
+
+        self.book = Book.objects.create(
+            title="Budget Book",
+            author="Test Author",
+            cover="HARD",
+            inventory=100,
+            daily_fee=Decimal("1.00"),
+        )
+        self.borrowing = self.create_borrowings(1)[0]
+        self.list_url = reverse("borrowings:borrowing-list")
+
+    def create_borrowings(self, count):
+        return Borrowing.objects.bulk_create(
+            Borrowing(
+                book=self.book,
+                user=self.user,
+                expected_return_date=timezone.now().date(),
+            )
+            for _ in range(count)
+        )
+
+    def test_list_budget_does_not_grow_with_rows(self):
+        for rows in (1, 20):
+            self.create_borrowings(rows)
+            for role, params in (
+                ("user", {}),
+                ("user", {"is_active": "true", "page_size": 5}),
+                ("staff", {}),
+                ("staff", {"user_id": self.user.id}),
+            ):
+                with self.subTest(rows=rows, role=role, params=params):
+                    with self.assertNumQueries(
+                        BORROWING_QUERY_BUDGETS[("list", role)]
+                    ):
+                        self.clients[role].get(self.list_url, params)
+
+    def test_paginated_pages_are_validated_without_a_full_aggregate(self):
+        self.create_borrowings(20)
+        params = {"page_size": 5}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.clients["staff"].get(self.list_url, params)
+        self.assertEqual(
+            len(queries), BORROWING_QUERY_BUDGETS[("list", "staff")]
+        )
+        for query in queries:
+            self.assertNotRegex(query["sql"], r"COUNT\(|MAX\(")
+            self.assertIn("LIMIT 6", query["sql"])
+
+        etag = response["ETag"]
+        response = self.clients["staff"].get(
+            self.list_url, params, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # A row on the page changes, its ETag does too.
+        self.borrowing.return_book()
+        response = self.clients["staff"].get(
+            self.list_url, params, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_retrieve_budget(self):
+        detail_url = reverse(
+            "borrowings:borrowing-detail", args=[self.borrowing.id]
+        )
+        for role in ("user", "staff"):
+            with self.subTest(role=role):
+                with self.assertNumQueries(
+                    BORROWING_QUERY_BUDGETS[("retrieve", role)]
+                ):
+                    response = self.clients[role].get(detail_url)
+                self.assertEqual(response.json()["book"]["id"], self.book.id)
+
+    def test_create_and_return_budgets(self):
+        with self.assertNumQueries(
+            BORROWING_QUERY_BUDGETS[("create", "user")]
+        ):
+            response = self.clients["user"].post(
+                self.list_url,
+                {
+                    "book": self.book.id,
+                    "expected_return_date": (
+                        timezone.now().date() + timezone.timedelta(days=7)
+                    ).isoformat(),
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+        return_url = reverse(
+            "borrowings:borrowing-return-borrowing", args=[self.borrowing.id]
+        )
+        with self.assertNumQueries(
+            BORROWING_QUERY_BUDGETS[("return", "user")]
+        ):
+            response = self.clients["user"].post(return_url, {})
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get_budget_and_invalidation(self):
+        response = self.clients["user"].get(self.list_url)
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+        active_etag = self.clients["user"].get(
+            self.list_url, {"is_active": "true"}
+        )["ETag"]
+
+        with self.assertNumQueries(
+            BORROWING_QUERY_BUDGETS[("not_modified", "user")]
+        ):
+            response = self.clients["user"].get(
+                self.list_url, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+        self.borrowing.return_book()
+        response = self.clients["user"].get(
+            self.list_url, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.clients["user"].get(
+            self.list_url,
+            {"is_active": "true"},
+            HTTP_IF_NONE_MATCH=active_etag,
+        )
+        self.assertEqual(response.status_code, 200)
+
+        detail_url = reverse(
+            "borrowings:borrowing-detail", args=[self.borrowing.id]
+        )
+        response = self.clients["user"].get(detail_url)
+        response = self.clients["user"].get(
+            detail_url, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+        other_user_etag = self.clients["staff"].get(self.list_url)["ETag"]
+        self.assertNotEqual(other_user_etag, etag)
+
+    def test_checkout_budget_does_not_grow_with_basket(self):
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"Basket Book {i}",
+                author="Test Author",
+                cover="SOFT",
+                inventory=1,
+                daily_fee=Decimal("1.00"),
+            )
+            for i in range(6)
+        )
+        for basket in (books[:1], books[1:]):
+            with self.assertNumQueries(
+                BORROWING_QUERY_BUDGETS[("checkout", "user")]
+            ):
+                response = self.clients["user"].post(
+                    reverse("borrowings:borrowing-checkout"),
+                    {
+                        "books": [book.id for book in basket],
+                        "expected_return_date": "2030-01-01",
+                    },
+                    format="json",
+                )
+            self.assertEqual(response.status_code, 201)
+
+
+class AsyncBorrowingListTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin_user = User.objects.create_user(
+            email="admin@admin.com", password="<PASSWORD>", is_staff=True
+        )
+        self.user = User.objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        other_user = User.objects.create_user(
+            email="other@user.com", password="<PASSWORD>"
+        )
+        self.clients = {}
+        self.headers = {}
+        for role, user in (("staff", self.admin_user), ("user", self.user)):
+            token = str(RefreshToken.for_user(user).access_token)
+            self.clients[role] = APIClient()
+            self.clients[role].credentials(
+                HTTP_AUTHORIZATION=f"Bearer {token}"
+            )
+            self.headers[role] = {"Authorization": f"Bearer {token}"}
+            get_user_state(user.id)
+
+        book = Book.objects.create(
+            title="Async Book",
+            author="Test Author",
+            cover="HARD",
+            inventory=10,
+            daily_fee=Decimal("1.00"),
+        )
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                book=book,
+                user=user,
+                expected_return_date=timezone.now().date(),
+                actual_return_date=returned,
+            )
+            for user, returned in (
+                (self.user, None),
+                (self.user, timezone.now().date()),
+                (self.user, None),
+                (other_user, None),
+            )
+        )
+        self.url = reverse("async-borrowings:borrowing-list")
+        self.sync_url = reverse("borrowings:borrowing-list")
+        self.get = async_to_sync(self.async_client.get)
+
+    def test_async_list_matches_sync_list(self):
+        for role, params in (
+            ("user", {}),
+            ("user", {"is_active": "false"}),
+            ("staff", {}),
+            ("staff", {"user_id": self.user.id, "is_active": "true"}),
+        ):
+            with self.subTest(role=role, params=params):
+                with self.assertNumQueries(
+                    BORROWING_QUERY_BUDGETS[("async_list", role)]
+                ):
+                    response = self.get(
+                        self.url, params, headers=self.headers[role]
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.json(),
+                    self.clients[role].get(self.sync_url, params).json(),
+                )
+
+    def test_async_list_pages_and_revalidates(self):
+        response = self.get(
+            self.url, {"page_size": 2}, headers=self.headers["user"]
+        )
+        first = response.json()
+        self.assertEqual(len(first["results"]), 2)
+        second = self.get(
+            first["next"], headers=self.headers["user"]
+        ).json()
+        self.assertEqual(len(second["results"]), 1)
+        self.assertIsNone(second["next"])
+
+        etag = self.get(self.url, headers=self.headers["user"])["ETag"]
+        response = self.get(
+            self.url,
+            headers={**self.headers["user"], "If-None-Match": etag},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_async_list_requires_valid_token(self):
+        self.assertEqual(self.get(self.url).status_code, 401)
+        response = self.get(
+            self.url, headers={"Authorization": "Bearer broken"}
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["code"], "token_not_valid")
+
+
+class BorrowingCheckoutTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.books = Book.objects.bulk_create(
+            Book(
+                title=f"Kiosk Book {i}",
+                author="Test Author",
+                cover="SOFT",
+                inventory=2,
+                daily_fee=Decimal("1.00"),
+            )
+            for i in range(3)
+        )
+        self.url = reverse("borrowings:borrowing-checkout")
+
+    def checkout(self, book_ids):
+        return self.client.post(
+            self.url,
+            {"books": book_ids, "expected_return_date": "2030-01-01"},
+            format="json",
+        )
+
+    def test_checkout_borrows_every_book_with_one_notification(self):
+        response = self.checkout([book.id for book in self.books])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [item["book"] for item in response.json()],
+            [book.id for book in self.books],
+        )
+        self.assertEqual(
+            Borrowing.objects.filter(user=self.user).count(), 3
+        )
+        for book in self.books:
+            book.refresh_from_db()
+            self.assertEqual(book.inventory, 1)
+        notification = OutboxMessage.objects.get()
+        self.assertIn("Kiosk Book 2", notification.text)
+
+    def test_checkout_reports_per_book_failures_without_commit(self):
+        Book.objects.filter(id=self.books[1].id).update(inventory=0)
+
+        response = self.checkout([self.books[0].id, self.books[1].id, 9999])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["books"],
+            {
+                str(self.books[1].id): "No copies of this book are available.",
+                "9999": "Book not found.",
+            },
+        )
+        self.assertFalse(Borrowing.objects.exists())
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].inventory, 2)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_checkout_rolls_back_when_stock_runs_out_mid_checkout(self):
+        sold_out = self.books[2]
+        stale_books = Book.objects.in_bulk([book.id for book in self.books])
+        Book.objects.filter(id=sold_out.id).update(inventory=0)
+
+        with patch.object(Book.objects, "in_bulk", return_value=stale_books):
+            response = self.checkout([book.id for book in self.books])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()["books"]), [str(sold_out.id)])
+        self.assertFalse(Borrowing.objects.exists())
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].inventory, 2)
+
+    def test_checkout_reports_a_sold_out_sharded_book(self):
+        sold_out = self.books[2]
+        Book.objects.compact_shards(sold_out.id, shards=2)
+        InventoryShard.objects.filter(book=sold_out).update(copies=0)
+
+        response = self.checkout([book.id for book in self.books])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["books"],
+            {str(sold_out.id): "No copies of this book are available."},
+        )
+        self.assertFalse(Borrowing.objects.exists())
+
+    def test_checkout_rejects_duplicate_books(self):
+        response = self.checkout([self.books[0].id, self.books[0].id])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("books", response.json())
+
+
+class BorrowingBulkReturnTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin_user = User.objects.create_user(
+            email="admin@admin.com", password="<PASSWORD>", is_staff=True
+        )
+        self.user = User.objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        self.books = Book.objects.bulk_create(
+            Book(
+                title=f"Drop Box Book {i}",
+                author="Test Author",
+                cover="SOFT",
+                inventory=0,
+                daily_fee=Decimal("1.00"),
+            )
+            for i in range(2)
+        )
+        self.url = reverse("borrowings:borrowing-bulk-return")
+
+    def create_borrowings(self, book, count):
+        return Borrowing.objects.bulk_create(
+            Borrowing(
+                book=book,
+                user=self.user,
+                expected_return_date=timezone.now().date(),
+            )
+            for _ in range(count)
+        )
+
+    def bulk_return(self, user, ids):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(self.url, {"borrowings": ids}, format="json")
+
+    def test_bulk_return_reports_per_id_and_restores_inventory(self):
+        first = self.create_borrowings(self.books[0], 3)
+        second = self.create_borrowings(self.books[1], 1)
+        first[0].return_book()
+
+        ids = [borrowing.id for borrowing in first + second] + [9999]
+        response = self.bulk_return(self.admin_user, ids)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["results"],
+            [{"id": first[0].id, "status": "already_returned"}]
+            + [
+                {"id": borrowing.id, "status": "returned"}
+                for borrowing in first[1:] + second
+            ]
+            + [{"id": 9999, "status": "not_found"}],
+        )
+        self.assertFalse(
+            Borrowing.objects.filter(actual_return_date__isnull=True).exists()
+        )
+        inventories = [
+            Book.objects.get(id=book.id).inventory for book in self.books
+        ]
+        self.assertEqual(inventories, [3, 1])
+
+    def test_bulk_return_budget_does_not_grow_with_batch(self):
+        for count in (1, 25):
+            ids = [
+                borrowing.id
+                for borrowing in self.create_borrowings(self.books[0], count)
+            ]
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION="Bearer "
+                + str(RefreshToken.for_user(self.admin_user).access_token)
+            )
+            get_user_state(self.admin_user.id)
+            with self.assertNumQueries(
+                BORROWING_QUERY_BUDGETS[("bulk_return", "staff")]
+            ):
+                response = client.post(
+                    self.url, {"borrowings": ids}, format="json"
+                )
+            self.assertEqual(response.status_code, 200)
+
+    def test_bulk_return_is_staff_only(self):
+        borrowing = self.create_borrowings(self.books[0], 1)[0]
+        response = self.bulk_return(self.user, [borrowing.id])
+        self.assertEqual(response.status_code, 403)
+
+
+class BorrowingExportTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin_user = User.objects.create_user(
+            email="admin@admin.com", password="<PASSWORD>", is_staff=True
+        )
+        self.user = User.objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        self.other_user = User.objects.create_user(
+            email="other@user.com", password="<PASSWORD>"
+        )
+        self.book = Book.objects.create(
+            title="Export Book",
+            author="Test Author",
+            cover="HARD",
+            inventory=10,
+            daily_fee=Decimal("1.00"),
+        )
+        self.borrowings = Borrowing.objects.bulk_create(
+            Borrowing(
+                book=self.book,
+                user=user,
+                expected_return_date=datetime.date(2024, 2, 1),
+            )
+            for user in (self.user, self.user, self.other_user)
+        )
+        Borrowing.objects.filter(id=self.borrowings[0].id).update(
+            borrow_date=datetime.date(2023, 12, 31)
+        )
+        self.url = reverse("borrowings:borrowing-export")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer "
+            + str(RefreshToken.for_user(self.admin_user).access_token)
+        )
+        get_user_state(self.admin_user.id)
+
+    def export(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export_streams_filtered_rows(self):
+        rows = list(
+            csv.DictReader(
+                self.export(
+                    {
+                        "user_id": self.user.id,
+                        "borrowed_from": "2024-01-01",
+                    }
+                ).splitlines()
+            )
+        )
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["id"], str(self.borrowings[1].id))
+        self.assertEqual(rows[0]["user_email"], "user@user.com")
+        self.assertEqual(rows[0]["book_title"], "Export Book")
+        self.assertEqual(rows[0]["actual_return_date"], "")
+
+    def test_ndjson_export_runs_a_single_query(self):
+        with self.assertNumQueries(
+            BORROWING_QUERY_BUDGETS[("export", "staff")]
+        ):
+            content = self.export(
+                {"output": "ndjson", "borrowed_to": "2023-12-31"}
+            )
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.borrowings[0].id])
+        self.assertEqual(rows[0]["borrow_date"], "2023-12-31")
+
+    def test_export_rejects_bad_params_and_non_staff(self):
+        for params in ({"output": "xml"}, {"borrowed_from": "yesterday"}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+
+        user_client = APIClient()
+        user_client.force_authenticate(self.user)
+        self.assertEqual(user_client.get(self.url).status_code, 403)
+
+
+@override_settings(BORROWING_REMINDER_DAYS=1)
+class BorrowingReminderTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        self.book = Book.objects.create(
+            title="Reminder Book",
+            author="Test Author",
+            cover="HARD",
+            inventory=10,
+            daily_fee=Decimal("1.00"),
+        )
+        self.today = timezone.now().date()
+
+    def create_borrowings(self, days, count=1, **kwargs):
+        return Borrowing.objects.bulk_create(
+            Borrowing(
+                book=self.book,
+                user=self.user,
+                expected_return_date=self.today + datetime.timedelta(days),
+                **kwargs,
+            )
+            for _ in range(count)
+        )
+
+    def test_reminds_only_the_due_bucket_once(self):
+        due = self.create_borrowings(1)[0]
+        overdue = self.create_borrowings(-3)[0]
+        self.create_borrowings(5)
+        self.create_borrowings(1, actual_return_date=self.today)
+        self.create_borrowings(1, reminder_sent_at=timezone.now())
+
+        self.assertEqual(send_due_reminders_task(), 2)
+        self.assertEqual(send_due_reminders_task(), 0)
+
+        for borrowing in (due, overdue):
+            borrowing.refresh_from_db()
+            self.assertIsNotNone(borrowing.reminder_sent_at)
+        texts = list(OutboxMessage.objects.values_list("text", flat=True))
+        self.assertEqual(len(texts), 2)
+        self.assertIn("Reminder Book", texts[0])
+        self.assertIn(str(overdue.expected_return_date), texts[0])
+
+    @override_settings(BORROWING_REMINDER_BATCH_SIZE=10)
+    def test_cost_follows_reminders_not_table_size(self):
+        self.create_borrowings(30, count=50)
+        for due in (1, 9):
+            self.create_borrowings(0, count=due)
+            # savepoint, bucket read, update, outbox insert, release
+            with self.assertNumQueries(5):
+                self.assertEqual(send_due_reminders_task(), due)
+
+
+class BorrowingFineTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin_user = User.objects.create_user(
+            email="admin@admin.com", password="<PASSWORD>", is_staff=True
+        )
+        self.user = User.objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        self.other_user = User.objects.create_user(
+            email="other@user.com", password="<PASSWORD>"
+        )
+        self.book = Book.objects.create(
+            title="Fine Book",
+            author="Test Author",
+            cover="HARD",
+            inventory=10,
+            daily_fee=Decimal("1.10"),
+        )
+        self.today = timezone.now().date()
+        self.clients = {}
+        for role, user in (("staff", self.admin_user), ("user", self.user)):
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION="Bearer "
+                + str(RefreshToken.for_user(user).access_token)
+            )
+            get_user_state(user.id)
+            self.clients[role] = client
+
+    def create_borrowing(self, days_overdue, user=None, **kwargs):
+        return Borrowing.objects.bulk_create(
+            [
+                Borrowing(
+                    book=self.book,
+                    user=user or self.user,
+                    expected_return_date=self.today
+                    - datetime.timedelta(days_overdue),
+                    **kwargs,
+                )
+            ]
+        )[0]
+
+    def fine(self, borrowing):
+        borrowing.refresh_from_db()
+        return borrowing.fine
+
+    def test_recompute_prices_open_overdue_days_exactly(self):
+        overdue = self.create_borrowing(3)
+        long_overdue = self.create_borrowing(40)
+        not_due = self.create_borrowing(-1)
+        returned = self.create_borrowing(
+            10, actual_return_date=self.today, fine=Decimal("9.90")
+        )
+
+        self.assertEqual(recompute_fines_task(), 2)
+
+        self.assertEqual(self.fine(overdue), Decimal("3.30"))
+        self.assertEqual(self.fine(long_overdue), Decimal("44.00"))
+        self.assertEqual(self.fine(not_due), Decimal("0.00"))
+        self.assertEqual(self.fine(returned), Decimal("9.90"))
+
+    def test_returns_settle_the_final_fine(self):
+        single = self.create_borrowing(2)
+        response = self.clients["user"].post(
+            reverse("borrowings:borrowing-return-borrowing", args=[single.id])
+        )
+        self.assertEqual(response.json()["fine"], "2.20")
+
+        bulk = [self.create_borrowing(5), self.create_borrowing(0)]
+        self.clients["staff"].post(
+            reverse("borrowings:borrowing-bulk-return"),
+            {"borrowings": [borrowing.id for borrowing in bulk]},
+            format="json",
+        )
+        self.assertEqual(
+            [self.fine(borrowing) for borrowing in bulk],
+            [Decimal("5.50"), Decimal("0.00")],
+        )
+
+    def test_balance_and_staff_report(self):
+        self.create_borrowing(0, fine=Decimal("0.10"))
+        self.create_borrowing(0, fine=Decimal("0.20"))
+        self.create_borrowing(0, user=self.other_user, fine=Decimal("5.00"))
+        self.create_borrowing(0, user=self.other_user)
+
+        with self.assertNumQueries(
+            BORROWING_QUERY_BUDGETS[("balance", "user")]
+        ):
+            response = self.clients["user"].get(
+                reverse("borrowings:borrowing-balance")
+            )
+        self.assertEqual(
+            response.json(), {"outstanding": "0.30", "fined_borrowings": 2}
+        )
+
+        report_url = reverse("borrowings:borrowing-fines-report")
+        with self.assertNumQueries(
+            BORROWING_QUERY_BUDGETS[("fines_report", "staff")]
+        ):
+            response = self.clients["staff"].get(report_url)
+        self.assertEqual(
+            response.json(),
+            {
+                "outstanding": "5.30",
+                "users": [
+                    {
+                        "outstanding": "5.00",
+                        "fined_borrowings": 1,
+                        "user_id": self.other_user.id,
+                        "email": "other@user.com",
+                    },
+                    {
+                        "outstanding": "0.30",
+                        "fined_borrowings": 2,
+                        "user_id": self.user.id,
+                        "email": "user@user.com",
+                    },
+                ],
+            },
+        )
+        self.assertEqual(
+            self.clients["user"].get(report_url).status_code, 403
+        )
+
+
+def circulation_rollups():
+    return (
+        sorted(
+            DailyCirculation.objects.values_list(
+                "day", "borrowed", "returned"
+            )
+        ),
+        sorted(
+            BookCirculation.objects.values_list(
+                "book_id", "borrowed", "active"
+            )
+        ),
+        sorted(
+            AuthorCirculation.objects.values_list(
+                "author", "borrowed", "active"
+            )
+        ),
+    )
+
+
+class CirculationRollupTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin_user = User.objects.create_user(
+            email="admin@admin.com", password="<PASSWORD>", is_staff=True
+        )
+        self.user = User.objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        self.books = Book.objects.bulk_create(
+            Book(
+                title=f"Rollup Book {i}",
+                author=author,
+                cover="SOFT",
+                inventory=10,
+                daily_fee=Decimal("1.00"),
+            )
+            for i, author in enumerate(("Author A", "Author A", "Author B"))
+        )
+        self.today = timezone.now().date()
+
+    def borrow(self, book, count=1):
+        return Borrowing.objects.bulk_create(
+            Borrowing(
+                book=book, user=self.user, expected_return_date=self.today
+            )
+            for _ in range(count)
+        )
+
+    def test_catch_up_counts_each_borrow_and_return_once(self):
+        first = self.borrow(self.books[0], 3)
+        self.borrow(self.books[2])
+        self.assertEqual(catch_up_rollups(batch_size=2), 4)
+        self.assertEqual(catch_up_rollups(batch_size=2), 0)
+
+        Borrowing.objects.filter(id__in=[first[0].id, first[1].id]).update(
+            actual_return_date=self.today
+        )
+        self.assertEqual(catch_up_rollups(batch_size=100), 2)
+        self.assertEqual(catch_up_rollups(batch_size=100), 0)
+
+        self.assertEqual(
+            circulation_rollups(),
+            (
+                [(self.today, 4, 2)],
+                [(self.books[0].id, 3, 1), (self.books[2].id, 1, 1)],
+                [("Author A", 3, 1), ("Author B", 1, 1)],
+            ),
+        )
+
+    def test_catch_up_cost_follows_new_rows(self):
+        self.borrow(self.books[0], 50)
+        catch_up_rollups(batch_size=100)
+        for new in (1, 20):
+            self.borrow(self.books[1], new)
+            # savepoint, pending read, authors read, three upserts, stage
+            # update, release
+            with self.assertNumQueries(8):
+                self.assertEqual(catch_up_rollups(batch_size=100), new)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for book in self.books:
+            self.borrow(book, 2)
+        Borrowing.objects.filter(book=self.books[1]).update(
+            actual_return_date=self.today
+        )
+        catch_up_rollups(batch_size=100)
+        incremental = circulation_rollups()
+
+        self.assertEqual(rebuild_rollups(), 6)
+        self.assertEqual(circulation_rollups(), incremental)
+        self.assertEqual(catch_up_rollups(batch_size=100), 0)
+
+    def test_return_during_rebuild_is_left_to_the_catch_up(self):
+        borrowing = self.borrow(self.books[0])[0]
+        bulk_create = DailyCirculation.objects.bulk_create
+
+        def return_after_the_counts(*args, **kwargs):
+            # On PostgreSQL this return waits for the rebuild to commit.
+            Borrowing.objects.filter(pk=borrowing.pk).update(
+                actual_return_date=self.today
+            )
+            return bulk_create(*args, **kwargs)
+
+        with patch.object(
+            DailyCirculation.objects, "bulk_create", return_after_the_counts
+        ):
+            self.assertEqual(rebuild_rollups(), 1)
+        self.assertEqual(catch_up_rollups(batch_size=100), 1)
+        self.assertEqual(
+            circulation_rollups()[1], [(self.books[0].id, 1, 0)]
+        )
+
+    def test_analytics_endpoint(self):
+        self.borrow(self.books[0], 2)
+        self.borrow(self.books[2])
+        catch_up_rollups(batch_size=100)
+
+        url = reverse("borrowings:borrowing-analytics")
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION="Bearer "
+            + str(RefreshToken.for_user(self.admin_user).access_token)
+        )
+        get_user_state(self.admin_user.id)
+        with self.assertNumQueries(
+            BORROWING_QUERY_BUDGETS[("analytics", "staff")]
+        ):
+            response = client.get(url, {"days": 7})
+        data = response.json()
+
+        self.assertEqual(len(data["daily"]), 7)
+        self.assertEqual(
+            data["daily"][-1],
+            {"day": self.today.isoformat(), "borrowed": 3, "returned": 0},
+        )
+        self.assertEqual(data["daily"][0]["borrowed"], 0)
+        self.assertEqual(
+            [(book["title"], book["active"]) for book in data["books"]],
+            [("Rollup Book 0", 2), ("Rollup Book 2", 1)],
+        )
+        self.assertEqual(
+            data["authors"],
+            [
+                {"author": "Author A", "borrowed": 2, "active": 2},
+                {"author": "Author B", "borrowed": 1, "active": 1},
+            ],
+        )
+        # Authors are read from their own rollup, not grouped per request.
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        self.assertFalse(
+            any("GROUP BY" in query["sql"] for query in queries)
+        )
+
+        self.assertEqual(client.get(url, {"days": 0}).status_code, 400)
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(url).status_code, 403)
+
+
+class BorrowingArchiveTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin_user = User.objects.create_user(
+            email="admin@admin.com", password="<PASSWORD>", is_staff=True
+        )
+        self.user = User.objects.create_user(
+            email="user@user.com", password="<PASSWORD>"
+        )
+        self.book = Book.objects.create(
+            title="Archive Book",
+            author="Test Author",
+            cover="HARD",
+            inventory=10,
+            daily_fee=Decimal("1.00"),
+        )
+        self.today = timezone.now().date()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer "
+            + str(RefreshToken.for_user(self.admin_user).access_token)
+        )
+        get_user_state(self.admin_user.id)
+
+        # Three borrowings returned over a year ago, one returned
+        # yesterday and one still open.
+        self.old = self.borrow(3, days_ago=400, returned_days_ago=380)
+        self.recent = self.borrow(1, days_ago=10, returned_days_ago=1)
+        self.open = self.borrow(1, days_ago=5)
+        catch_up_rollups(batch_size=100)
+
+    def borrow(self, count, days_ago, returned_days_ago=None, **kwargs):
+        borrowings = Borrowing.objects.bulk_create(
+            Borrowing(
+                book=self.book,
+                user=self.user,
+                expected_return_date=self.today,
+                **kwargs,
+            )
+            for _ in range(count)
+        )
+        Borrowing.objects.filter(
+            id__in=[borrowing.id for borrowing in borrowings]
+        ).update(
+            borrow_date=self.today - datetime.timedelta(days_ago),
+            actual_return_date=(
+                None
+                if returned_days_ago is None
+                else self.today - datetime.timedelta(returned_days_ago)
+            ),
+        )
+        return [borrowing.id for borrowing in borrowings]
+
+    def history(self, **params):
+        return self.client.get(
+            reverse("borrowings:borrowing-history"), params
+        ).json()
+
+    def test_archives_only_old_counted_returns_in_batches(self):
+        rollups = circulation_rollups()
+        # Not counted by the rollups yet, so it must stay for now.
+        pending = self.borrow(1, days_ago=400, returned_days_ago=380)
+
+        self.assertEqual(archive_borrowings(365, batch_size=2), 3)
+        self.assertEqual(archive_borrowings(365, batch_size=2), 0)
+
+        self.assertCountEqual(
+            ArchivedBorrowing.objects.values_list("id", flat=True), self.old
+        )
+        self.assertCountEqual(
+            Borrowing.objects.values_list("id", flat=True),
+            self.recent + self.open + pending,
+        )
+
+        Borrowing.objects.filter(id__in=pending).delete()
+        self.assertEqual(rebuild_rollups(), 5)
+        self.assertEqual(circulation_rollups(), rollups)
+
+    def test_history_merges_archived_rows_and_pages(self):
+        archive_borrowings(365, batch_size=100)
+        everything = self.old + self.recent + self.open
+
+        with self.assertNumQueries(
+            BORROWING_QUERY_BUDGETS[("history", "staff")]
+        ):
+            hot = self.history()
+        self.assertEqual(
+            [(row["id"], row["archived"]) for row in hot],
+            [(pk, False) for pk in self.recent + self.open],
+        )
+
+        with self.assertNumQueries(
+            BORROWING_QUERY_BUDGETS[("history", "staff", "archived")]
+        ):
+            rows = self.history(include_archived=1)
+        self.assertEqual([row["id"] for row in rows], everything)
+        self.assertEqual(
+            [row["archived"] for row in rows], [True] * 3 + [False] * 2
+        )
+
+        page = self.history(include_archived=1, page_size=2)
+        paged = [row["id"] for row in page["results"]]
+        while page["next"]:
+            page = self.client.get(page["next"]).json()
+            paged += [row["id"] for row in page["results"]]
+        self.assertEqual(paged, everything)
+        previous = self.client.get(page["previous"]).json()
+        self.assertEqual(
+            [row["id"] for row in previous["results"]], everything[2:4]
+        )
+
+        other = Book.objects.create(
+            title="Other Book",
+            author="Test Author",
+            cover="SOFT",
+            inventory=1,
+            daily_fee=Decimal("1.00"),
+        )
+        self.assertEqual(
+            self.history(include_archived=1, book_id=other.id), []
+        )
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse("borrowings:borrowing-history"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_fines_and_export_include_archived_borrowings(self):
+        Borrowing.objects.filter(id=self.old[0]).update(fine=Decimal("2.00"))
+        Borrowing.objects.filter(id=self.open[0]).update(fine=Decimal("1.50"))
+        archive_borrowings(365, batch_size=100)
+
+        balance = APIClient()
+        balance.force_authenticate(self.user)
+        self.assertEqual(
+            balance.get(reverse("borrowings:borrowing-balance")).json(),
+            {"outstanding": "3.50", "fined_borrowings": 2},
+        )
+        report = self.client.get(
+            reverse("borrowings:borrowing-fines-report")
+        ).json()
+        self.assertEqual(report["users"][0]["fined_borrowings"], 2)
+
+        url = reverse("borrowings:borrowing-export")
+        for params, expected in (
+            ({}, self.recent + self.open),
+            (
+                {"include_archived": 1},
+                sorted(self.old + self.recent + self.open),
+            ),
+        ):
+            response = self.client.get(url, {"output": "ndjson", **params})
+            self.assertEqual(
+                [
+                    json.loads(line)["id"]
+                    for line in b"".join(response.streaming_content)
+                    .decode()
+                    .splitlines()
+                ],
+                expected,
+            )
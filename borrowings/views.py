@@ -1,10 +1,31 @@
+import datetime
+import heapq
+from itertools import islice
+
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from borrowings.models import Borrowing
+from books.cache import catalog_cache
+from borrowings.export import EXPORT_FORMATS
+from borrowings.fines import ZERO
+from borrowings.models import (
+    ArchivedBorrowing,
+    AuthorCirculation,
+    BookCirculation,
+    Borrowing,
+    DailyCirculation,
+)
+from borrowings.pagination import BorrowingCursorPagination
+from borrowings.returns import return_borrowings
 from borrowings.serializers import (
     BorrowingSerializer,
     BorrowingCreateSerializer,
@@ -12,18 +33,91 @@ from borrowings.serializers import (
     BorrowingAdminSerializer,
     BorrowingAdminDetailSerializer,
     BorrowingReturnSerializer,
+    BorrowingCheckoutSerializer,
+    BorrowingBulkReturnSerializer,
+    FineBalanceSerializer,
+    FineReportSerializer,
+    CirculationAnalyticsSerializer,
+    BorrowingHistorySerializer,
+)
+from library_service.conditional import conditional_get
+
+
+MAX_ANALYTICS_DAYS = 366
+ANALYTICS_TOP = 10
+TRUE_VALUES = ("true", "True", "1")
+HISTORY_FIELDS = (
+    "id",
+    "book_id",
+    "user_id",
+    "borrow_date",
+    "expected_return_date",
+    "actual_return_date",
+    "fine",
+    "archived",
 )
 
 
+def history_key(row):
+    return row["borrow_date"], row["id"]
+
+
+def filter_borrowings(queryset, user, query_params):
+    """Apply the visibility rules and ``user_id``/``is_active`` filters
+    shared by the sync and async borrowing lists.
+    """
+    if user.is_staff:
+        user_id = query_params.get("user_id")
+        if user_id:
+            queryset = queryset.filter(user_id=user_id)
+    else:
+        queryset = queryset.filter(user_id=user.id)
+
+    if query_params.get("is_active") in TRUE_VALUES:
+        queryset = queryset.filter(actual_return_date__isnull=True)
+    elif query_params.get("is_active") in ("false", "False", "0"):
+        queryset = queryset.filter(actual_return_date__isnull=False)
+
+    return queryset
+
+
+LIST_STATE = {
+    "count": Count("id"),
+    "max_id": Max("id"),
+    "last_modified": Max("updated_at"),
+}
+
+
+def list_state_queryset(queryset, request):
+    """The page a list request is served, as ``(id, updated_at)`` rows
+    including the look-ahead row, or ``None`` when not paginating.
+
+    Paginated ETags are built from these rows, one range scan, so a page
+    does not cost an aggregate over every borrowing in the filter.
+    """
+    page = BorrowingCursorPagination().get_page_queryset(queryset, request)
+    if page is None:
+        return None
+    return page.values_list("id", "updated_at")
+
+
+def list_etag_source(request, state):
+    return (
+        f"{request.user.id}:{request.user.is_staff}:"
+        f"{request.get_full_path()}:{state}"
+    )
+
+
 class BorrowingViewSet(
     viewsets.GenericViewSet,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
 ):
-    queryset = Borrowing.objects.all().prefetch_related("book")
+    queryset = Borrowing.objects.all()
     serializer_class = BorrowingSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = BorrowingCursorPagination
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -41,52 +135,408 @@ class BorrowingViewSet(
             return BorrowingCreateSerializer
         if self.action == "return_borrowing":
             return BorrowingReturnSerializer
+        if self.action == "checkout":
+            return BorrowingCheckoutSerializer
+        if self.action == "bulk_return":
+            return BorrowingBulkReturnSerializer
+        if self.action == "balance":
+            return FineBalanceSerializer
+        if self.action == "fines_report":
+            return FineReportSerializer
+        if self.action == "analytics":
+            return CirculationAnalyticsSerializer
+        if self.action == "history":
+            return BorrowingHistorySerializer
         return self.serializer_class
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = self.queryset
-
-        if user.is_staff:
-            user_id = self.request.query_params.get("user_id")
-            if user_id:
-                queryset = queryset.filter(user_id=user_id)
-        else:
-            queryset = queryset.filter(user=user)
-
-        if self.request.query_params.get("is_active") in ("true", "True", "1"):
-            queryset = queryset.filter(actual_return_date__isnull=True)
-        elif self.request.query_params.get("is_active") in (
-            "false",
-            "False",
-            "0",
-        ):
-            queryset = queryset.filter(actual_return_date__isnull=False)
+        queryset = super().get_queryset()
 
-        return queryset.distinct()
+        if self.action == "retrieve":
+            # The detail nests the book.
+            queryset = queryset.select_related("book")
+
+        return filter_borrowings(
+            queryset, self.request.user, self.request.query_params
+        )
 
+    def get_history_querysets(self):
+        """The borrowings of ``get_queryset`` and, with
+        ``?include_archived=true``, their archived counterparts.
+        """
+        querysets = [self.get_queryset()]
+        if self.request.query_params.get("include_archived") in TRUE_VALUES:
+            querysets.append(
+                filter_borrowings(
+                    ArchivedBorrowing.objects.all(),
+                    self.request.user,
+                    self.request.query_params,
+                )
+            )
+        return querysets
+
+    def get_list_validators(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        page = list_state_queryset(queryset, request)
+        state = (
+            list(page) if page is not None
+            else queryset.aggregate(**LIST_STATE)
+        )
+        # No Last-Modified: it would not move when borrowings leave the
+        # list (returned, archived), while count and max id in the ETag do.
+        return list_etag_source(request, state), None
+
+    def get_detail_validators(self, request, *args, **kwargs):
+        try:
+            state = (
+                self.get_queryset()
+                .filter(pk=kwargs["pk"])
+                .values(
+                    "updated_at", "book__updated_at", "book__inventory_shards"
+                )
+                .first()
+            )
+        except (TypeError, ValueError):
+            state = None
+        if state is None:
+            return None, None
+
+        # The detail representation nests the book, so it changes with it.
+        last_modified = max(
+            filter(None, (state["updated_at"], state["book__updated_at"]))
+        )
+        etag_source = (
+            f"{request.user.id}:{request.user.is_staff}:"
+            f"{request.get_full_path()}:{last_modified}"
+        )
+        if state["book__inventory_shards"]:
+            # Shard claims leave the book's updated_at alone, the catalog
+            # version moves with them.
+            return f"{etag_source}:{catalog_cache.get_version()}", None
+        return etag_source, last_modified
+
+    @conditional_get("get_detail_validators")
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @extend_schema(request=None)
     @action(detail=True, methods=["POST"], url_path="return")
     def return_borrowing(self, request, pk=None):
-        borrowing = self.get_object()
+        """Return a borrowing and put its copy back on the shelf.
 
-        if not request.user.is_staff and borrowing.user != request.user:
-            return Response(
+        Users can only return their own borrowings. Of concurrent returns
+        of the same borrowing exactly one succeeds, the others are told
+        it has already been returned.
+        """
+        try:
+            queryset = self.get_queryset().filter(pk=pk)
+        except (TypeError, ValueError):
+            raise Http404
+        returned = return_borrowings(queryset)
+        if not returned:
+            # Not found for borrowings the user cannot see.
+            self.get_object()
+            raise ValidationError(
                 {
-                    "detail": (
-                        "You do not have permission to return this borrowing."
-                    )
-                },
-                status=status.HTTP_403_FORBIDDEN,
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        "This borrowing has already been returned."
+                    ]
+                }
             )
 
-        serializer = self.get_serializer(borrowing, data=request.data)
+        return Response(
+            self.get_serializer(returned[0]).data,
+            status=status.HTTP_200_OK,
+        )
+
+    @extend_schema(responses=BorrowingSerializer(many=True))
+    @action(detail=False, methods=["POST"], url_path="checkout")
+    def checkout(self, request):
+        """Borrow a basket of books in one transaction, all or nothing."""
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        borrowings = serializer.save(user=request.user)
 
         return Response(
-            serializer.data,
-            status=status.HTTP_200_OK,
+            BorrowingSerializer(borrowings, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="bulk-return",
+        permission_classes=(IsAdminUser,),
+    )
+    def bulk_return(self, request):
+        """(Admin only) Check in a batch of borrowings by id."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({"results": serializer.save()})
+
+    @action(detail=False, methods=["GET"], url_path="balance")
+    def balance(self, request):
+        """Outstanding fines of the current user."""
+        totals = {"outstanding": ZERO, "fined_borrowings": 0}
+        for model in (Borrowing, ArchivedBorrowing):
+            for key, value in (
+                model.objects.filter(user_id=request.user.id, fine__gt=0)
+                .aggregate(
+                    outstanding=Coalesce(Sum("fine"), ZERO),
+                    fined_borrowings=Count("id"),
+                )
+                .items()
+            ):
+                totals[key] += value
+        return Response(self.get_serializer(totals).data)
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="fines-report",
+        permission_classes=(IsAdminUser,),
+    )
+    def fines_report(self, request):
+        """(Admin only) Outstanding fines per user, largest first."""
+        totals = {}
+        for model in (Borrowing, ArchivedBorrowing):
+            for row in (
+                model.objects.filter(fine__gt=0)
+                .values("user_id")
+                .annotate(
+                    email=F("user__email"),
+                    outstanding=Sum("fine"),
+                    fined_borrowings=Count("id"),
+                )
+                .order_by()
+            ):
+                total = totals.setdefault(row["user_id"], row)
+                if total is not row:
+                    total["outstanding"] += row["outstanding"]
+                    total["fined_borrowings"] += row["fined_borrowings"]
+        users = sorted(
+            totals.values(),
+            key=lambda row: (-row["outstanding"], row["user_id"]),
+        )
+        report = {
+            "outstanding": sum(
+                (row["outstanding"] for row in users), start=ZERO
+            ),
+            "users": users,
+        }
+        return Response(self.get_serializer(report).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="days",
+                type=int,
+                description="Length of the daily series ending today,"
+                            f" 1-{MAX_ANALYTICS_DAYS} (default 30)",
+                required=False,
+            ),
+        ]
+    )
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="analytics",
+        permission_classes=(IsAdminUser,),
+    )
+    def analytics(self, request):
+        """(Admin only) Circulation statistics served from the rollups:
+        borrows and returns per day, and the books and authors with the
+        most loans.
+        """
+        try:
+            days = int(request.query_params.get("days", 30))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= MAX_ANALYTICS_DAYS:
+            raise ValidationError(
+                {"days": f"Use a number from 1 to {MAX_ANALYTICS_DAYS}."}
+            )
+
+        until = timezone.now().date()
+        since = until - datetime.timedelta(days=days - 1)
+        counted = {
+            row.day: row
+            for row in DailyCirculation.objects.filter(
+                day__range=(since, until)
+            )
+        }
+        daily = [
+            counted.get(day) or DailyCirculation(day=day)
+            for day in (
+                since + datetime.timedelta(days=offset)
+                for offset in range(days)
+            )
+        ]
+        books = (
+            BookCirculation.objects.select_related("book")
+            .filter(active__gt=0)
+            .order_by("-active", "book_id")[:ANALYTICS_TOP]
+        )
+        authors = AuthorCirculation.objects.order_by("-borrowed", "author")[
+            :ANALYTICS_TOP
+        ]
+        return Response(
+            self.get_serializer(
+                {"daily": daily, "books": books, "authors": authors}
+            ).data
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="user_id",
+                type=int,
+                description="Filter by user id (ex: ?user_id=1)",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="book_id",
+                type=int,
+                description="Filter by book id (ex: ?book_id=1)",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="include_archived",
+                type=bool,
+                description="Also list archived borrowings"
+                            " (ex: ?include_archived=1)",
+                required=False,
+            ),
+        ]
+    )
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="history",
+        permission_classes=(IsAdminUser,),
+    )
+    def history(self, request):
+        """(Admin only) Borrowing history ordered by borrow date, merging
+        archived borrowings in on request. Paginates like the list.
+        """
+        querysets = []
+        for archived, queryset in enumerate(self.get_history_querysets()):
+            book_id = request.query_params.get("book_id")
+            if book_id:
+                queryset = queryset.filter(book_id=book_id)
+            querysets.append(
+                queryset.annotate(archived=Value(bool(archived))).values(
+                    *HISTORY_FIELDS
+                )
+            )
+
+        paginator = self.paginator
+        pages = [
+            paginator.get_page_queryset(queryset, request)
+            for queryset in querysets
+        ]
+        if pages[0] is None:
+            rows = heapq.merge(
+                *(
+                    queryset.order_by("borrow_date", "id")
+                    for queryset in querysets
+                ),
+                key=history_key,
+            )
+            return Response(self.get_serializer(rows, many=True).data)
+
+        # Each side holds at most one page plus look-ahead past the
+        # cursor, so merging them and cutting again yields the page.
+        rows = heapq.merge(
+            *pages,
+            key=history_key,
+            reverse=bool(paginator.cursor and paginator.cursor.reverse),
+        )
+        page = paginator.set_page(list(islice(rows, paginator.page_size + 1)))
+        return paginator.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="output",
+                type=str,
+                enum=list(EXPORT_FORMATS),
+                description="Export format, csv (default) or ndjson",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="borrowed_from",
+                type=datetime.date,
+                description="Only borrowings made on or after this date"
+                            " (ex: ?borrowed_from=2024-01-31)",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="borrowed_to",
+                type=datetime.date,
+                description="Only borrowings made on or before this date"
+                            " (ex: ?borrowed_to=2024-12-31)",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="user_id",
+                type=int,
+                description="Filter by user id (ex: ?user_id=1)",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="include_archived",
+                type=bool,
+                description="Also export archived borrowings"
+                            " (ex: ?include_archived=1)",
+                required=False,
+            ),
+        ],
+        responses={(200, "text/csv"): str, (200, "application/x-ndjson"): str},
+    )
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="export",
+        permission_classes=(IsAdminUser,),
+    )
+    def export(self, request):
+        """(Admin only) Stream the borrowing history as CSV or NDJSON."""
+        output = request.query_params.get("output", "csv")
+        if output not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"output": f"Choose one of: {', '.join(EXPORT_FORMATS)}."}
+            )
+
+        filters = {}
+        for param, lookup in (
+            ("borrowed_from", "borrow_date__gte"),
+            ("borrowed_to", "borrow_date__lte"),
+        ):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                filters[lookup] = datetime.date.fromisoformat(value)
+            except ValueError:
+                raise ValidationError({param: "Use the YYYY-MM-DD format."})
+
+        stream, content_type = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(
+            stream(
+                [
+                    queryset.filter(**filters)
+                    for queryset in self.get_history_querysets()
+                ]
+            ),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="borrowings.{output}"'
         )
+        return response
 
     @extend_schema(
         parameters=[
@@ -105,5 +555,6 @@ class BorrowingViewSet(
             ),
         ]
     )
+    @conditional_get("get_list_validators")
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
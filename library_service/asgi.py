@@ -9,8 +9,23 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "library_service.settings")
 
-application = get_asgi_application()
+ASYNC_URLCONF = "library_service.async_urls"
+
+
+class AsyncRoutesHandler(ASGIHandler):
+    """Serve only the routes of ``ASYNC_URLCONF``; everything else is
+    left to the WSGI server.
+    """
+
+    async def get_response_async(self, request):
+        request.urlconf = ASYNC_URLCONF
+        return await super().get_response_async(request)
+
+
+django.setup(set_prefix=False)
+application = AsyncRoutesHandler()
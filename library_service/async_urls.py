@@ -0,0 +1,21 @@
+"""
+URL configuration served by the ASGI application.
+
+Only the async views are routed here. The sync DRF views would run on
+the single thread ASGI keeps for sync code, and streamed responses such
+as the borrowing export would be buffered whole, so they stay behind
+WSGI (``library_service.urls``).
+"""
+
+from django.urls import path, include
+
+urlpatterns = [
+    path(
+        "api/async/books/",
+        include("books.async_urls", namespace="async-books"),
+    ),
+    path(
+        "api/async/borrowings/",
+        include("borrowings.async_urls", namespace="async-borrowings"),
+    ),
+]
@@ -0,0 +1,79 @@
+import functools
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def conditional_get(validators):
+    """Viewset counterpart of ``django.views.decorators.http.condition``.
+
+    ``validators`` names a view method that takes the same arguments as the
+    decorated action and returns ``(etag_source, last_modified)``. Both are
+    meant to be cheap to compute, so a matching ``If-None-Match`` or
+    ``If-Modified-Since`` is answered with 304 before any serialization.
+    A ``None`` source means the resource does not exist.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def inner(self, request, *args, **kwargs):
+            etag, timestamp = make_validators(
+                request.accepted_media_type,
+                *getattr(self, validators)(request, *args, **kwargs),
+            )
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+            return set_validators(response, etag, timestamp)
+
+        return inner
+
+    return decorator
+
+
+def async_conditional_get(validators):
+    """``conditional_get`` for plain async views.
+
+    ``validators`` is a coroutine function taking the view's arguments;
+    responses are always JSON, so the ETag is keyed on that media type.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag, timestamp = make_validators(
+                "application/json",
+                *await validators(request, *args, **kwargs),
+            )
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            return set_validators(response, etag, timestamp)
+
+        return inner
+
+    return decorator
+
+
+def make_validators(media_type, etag_source, last_modified):
+    etag = None
+    if etag_source is not None:
+        etag = quote_etag(
+            hashlib.md5(f"{media_type}:{etag_source}".encode()).hexdigest()
+        )
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return etag, timestamp
+
+
+def set_validators(response, etag, timestamp):
+    if response.status_code in (200, 304):
+        if etag:
+            response.headers.setdefault("ETag", etag)
+        if timestamp:
+            response.headers.setdefault("Last-Modified", http_date(timestamp))
+    return response
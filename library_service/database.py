@@ -0,0 +1,150 @@
+"""Connection reuse and replicas for the ``DATABASES`` setting.
+
+``postgres_database`` reads everything from the environment so the same
+image can run with psycopg's connection pool (``DATABASE_POOL=1``) or
+with persistent per-thread connections (the default). Both keep
+connections across requests and check their health before reuse.
+"""
+
+
+def env_flag(env, name, default=False):
+    value = env.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def pool_processes(env):
+    """Number of processes that open a pool of their own: the WSGI
+    server's ``WEB_CONCURRENCY`` processes, the ``ASGI_CONCURRENCY``
+    uvicorn workers, the ``CELERY_CONCURRENCY`` worker children and beat.
+    """
+    return max(
+        1,
+        int(env.get("WEB_CONCURRENCY", 2))
+        + int(env.get("ASGI_CONCURRENCY", 1))
+        + int(env.get("CELERY_CONCURRENCY", 1))
+        + 1,
+    )
+
+
+def pool_options(env):
+    """Options for ``psycopg_pool.ConnectionPool``.
+
+    The pool lives in each process, so unless ``DATABASE_POOL_MAX_SIZE``
+    is given the ``DATABASE_MAX_CONNECTIONS`` budget is split across
+    ``pool_processes``.
+    """
+    min_size = int(env.get("DATABASE_POOL_MIN_SIZE", 2))
+    budget = int(env.get("DATABASE_MAX_CONNECTIONS", 80))
+    max_size = int(env.get("DATABASE_POOL_MAX_SIZE", 0)) or (
+        budget // pool_processes(env)
+    )
+    return {
+        "min_size": min_size,
+        "max_size": max(min_size, max_size),
+        # Seconds a request waits for a free connection before failing.
+        "timeout": float(env.get("DATABASE_POOL_TIMEOUT", 10)),
+        # Close connections idle for longer, down to min_size.
+        "max_idle": float(env.get("DATABASE_POOL_MAX_IDLE", 300)),
+        "max_lifetime": float(env.get("DATABASE_POOL_MAX_LIFETIME", 1800)),
+    }
+
+
+def postgres_database(env):
+    database = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": env["POSTGRES_DB"],
+        "USER": env["POSTGRES_USER"],
+        "PASSWORD": env["POSTGRES_PASSWORD"],
+        "HOST": env["POSTGRES_HOST"],
+        "PORT": env["POSTGRES_PORT"],
+        # Ping reused connections (pooled ones on checkout) so a server
+        # restart costs one retry instead of a failed request.
+        "CONN_HEALTH_CHECKS": True,
+    }
+    if env_flag(env, "DATABASE_POOL"):
+        # The pool owns connection lifetimes; Django rejects both at once.
+        database["CONN_MAX_AGE"] = 0
+        database["OPTIONS"] = {"pool": pool_options(env)}
+    else:
+        database["CONN_MAX_AGE"] = int(env.get("DATABASE_CONN_MAX_AGE", 60))
+    return database
+
+
+def replica_databases(primary, env):
+    """Replica entries cloned from the ``primary`` entry, keyed by alias.
+
+    ``POSTGRES_REPLICA_HOSTS`` lists ``host[:port]`` standbys of a
+    PostgreSQL primary; ``SQLITE_REPLICAS`` lists copies of a SQLite
+    primary file, for trying the routing locally. Tests run replicas as
+    mirrors of the primary test database.
+    """
+    if primary["ENGINE"].endswith("postgresql"):
+        overrides = []
+        for host in env.get("POSTGRES_REPLICA_HOSTS", "").split(","):
+            host, _, port = host.strip().partition(":")
+            if host:
+                overrides.append(
+                    {"HOST": host, "PORT": port or primary["PORT"]}
+                )
+    else:
+        overrides = [
+            {"NAME": name.strip()}
+            for name in env.get("SQLITE_REPLICAS", "").split(",")
+            if name.strip()
+        ]
+    return {
+        f"replica_{number}": {
+            **primary,
+            **override,
+            "TEST": {"MIRROR": "default"},
+        }
+        for number, override in enumerate(overrides, start=1)
+    }
+
+
+def connection_stats(connection):
+    """Reuse settings of one connection and, when pooled, the counters of
+    its pool since the process started.
+    """
+    settings_dict = connection.settings_dict
+    stats = {
+        "alias": connection.alias,
+        "vendor": connection.vendor,
+        "pooled": False,
+        "conn_max_age": settings_dict["CONN_MAX_AGE"],
+        "health_checks": settings_dict["CONN_HEALTH_CHECKS"],
+    }
+    pool = getattr(connection, "pool", None)
+    if pool is None:
+        return stats
+
+    counters = pool.get_stats()
+    checkouts = counters.get("requests_num", 0)
+    connections = counters.get("connections_num", 0)
+    stats.update(
+        pooled=True,
+        pool_min=counters["pool_min"],
+        pool_max=counters["pool_max"],
+        pool_size=counters["pool_size"],
+        pool_available=counters["pool_available"],
+        waiting=counters.get("requests_waiting", 0),
+        checkouts=checkouts,
+        checkouts_queued=counters.get("requests_queued", 0),
+        checkout_errors=counters.get("requests_errors", 0),
+        checkout_wait_ms_avg=(
+            counters.get("requests_wait_ms", 0) / checkouts
+            if checkouts
+            else 0
+        ),
+        connections_opened=connections,
+        connect_ms_avg=(
+            counters.get("connections_ms", 0) / connections
+            if connections
+            else 0
+        ),
+        connections_lost=counters.get("connections_lost", 0),
+        returns_bad=counters.get("returns_bad", 0),
+    )
+    return stats
@@ -0,0 +1,174 @@
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    TokenError,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import CachedJWTAuthentication
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_read_from_replica = ContextVar("read_from_replica", default=False)
+
+
+@contextmanager
+def primary_reads():
+    """Send the reads of the block to the primary.
+
+    For reads whose result outlives the request, such as cache fills: a
+    lagging replica must not be cached under a fresh version.
+    """
+    token = _read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Send reads to a random replica while the current request allows
+    it (see ``replica_routing_middleware``) and everything else to the
+    primary. Without ``DATABASE_REPLICAS`` every query goes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or Django would save rows where they were read from.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def pin_key(user_id):
+    return f"db:pin:{user_id}"
+
+
+def request_user_id(request):
+    """User id claim of the request's access token, without touching the
+    database; ``None`` for anonymous or invalid tokens.
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    try:
+        raw_token = header and authentication.get_raw_token(header)
+        if not raw_token:
+            return None
+        return AccessToken(raw_token)[api_settings.USER_ID_CLAIM]
+    except (AuthenticationFailed, TokenError, KeyError):
+        return None
+
+
+def may_use_replica(request):
+    return (
+        request.method in SAFE_METHODS
+        and request.path.startswith("/api/")
+        and bool(settings.DATABASE_REPLICAS)
+    )
+
+
+def pins_user(request, response, user_id):
+    return (
+        user_id is not None
+        and request.method not in SAFE_METHODS
+        and response.status_code < 400
+    )
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """Let safe API requests read from the replicas.
+
+    A successful write pins its user to the primary for
+    ``DATABASE_REPLICA_PIN_SECONDS``, so whoever just borrowed or
+    returned a book reads their own writes rather than stale inventory.
+    The pin lives in the shared cache and covers every process.
+    """
+    timeout = settings.DATABASE_REPLICA_PIN_SECONDS
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            user_id = request_user_id(request)
+            replica = may_use_replica(request) and not (
+                user_id is not None and await cache.aget(pin_key(user_id))
+            )
+            token = _read_from_replica.set(replica)
+            try:
+                response = await get_response(request)
+            finally:
+                _read_from_replica.reset(token)
+            if pins_user(request, response, user_id):
+                await cache.aset(pin_key(user_id), True, timeout)
+            return response
+
+    else:
+
+        def middleware(request):
+            user_id = request_user_id(request)
+            replica = may_use_replica(request) and not (
+                user_id is not None and cache.get(pin_key(user_id))
+            )
+            token = _read_from_replica.set(replica)
+            try:
+                response = get_response(request)
+            finally:
+                _read_from_replica.reset(token)
+            if pins_user(request, response, user_id):
+                cache.set(pin_key(user_id), True, timeout)
+            return response
+
+    return middleware
+
+
+PG_REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def replica_lag(connection):
+    """Seconds the replica behind ``connection`` trails the primary.
+
+    PostgreSQL standbys report how old their last replayed transaction
+    is, or 0 when they have replayed everything received. SQLite replicas
+    are copies of the primary file, so their lag is the age of the copy.
+    ``None`` when unknown or unreachable.
+    """
+    if connection.vendor == "postgresql":
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(PG_REPLICA_LAG)
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            return None
+        return None if lag is None else float(lag)
+    if connection.vendor == "sqlite":
+        try:
+            copied_at = os.path.getmtime(connection.settings_dict["NAME"])
+        except (OSError, TypeError):
+            return None
+        return max(0.0, time.time() - copied_at)
+    return None
@@ -13,8 +13,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from datetime import timedelta
 from pathlib import Path
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
+from library_service.database import postgres_database, replica_databases
+
 load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,6 +57,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "library_service.replicas.replica_routing_middleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -86,24 +90,29 @@ WSGI_APPLICATION = "library_service.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 if os.getenv("POSTGRES_DB"):
-    DATABASES = {
-        "default": {
-            "ENGINE": "django.db.backends.postgresql",
-            "NAME": os.environ["POSTGRES_DB"],
-            "USER": os.environ["POSTGRES_USER"],
-            "PASSWORD": os.environ["POSTGRES_PASSWORD"],
-            "HOST": os.environ["POSTGRES_HOST"],
-            "PORT": os.environ["POSTGRES_PORT"],
-        }
-    }
+    # Persistent connections by default, psycopg's pool with
+    # DATABASE_POOL=1; see library_service/database.py for the knobs.
+    DATABASES = {"default": postgres_database(os.environ)}
 else:
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # Take the write lock up front so concurrent checkouts queue on
+            # the busy timeout instead of failing on a lock upgrade.
+            "OPTIONS": {"transaction_mode": "IMMEDIATE"},
         }
     }
 
+DATABASES.update(replica_databases(DATABASES["default"], os.environ))
+# Safe API requests read from these; see library_service/replicas.py.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["library_service.replicas.PrimaryReplicaRouter"]
+# How long a user's reads stay on the primary after they write
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.getenv("DATABASE_REPLICA_PIN_SECONDS", 10)
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -160,24 +169,106 @@ AUTH_USER_MODEL = "users.User"
 # REST
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=5),
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.TokenObtainPairSerializer",
 }
 
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# Cache
+if os.getenv("REDIS_CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_CACHE_URL"],
+        }
+    }
+
+# Book catalog read cache
+BOOK_CACHE_LOCAL_SIZE = int(os.getenv("BOOK_CACHE_LOCAL_SIZE", 256))
+BOOK_CACHE_TIMEOUT = int(os.getenv("BOOK_CACHE_TIMEOUT", 300))
+# Identity and role of authenticated users, dropped whenever a user changes
+USER_STATE_CACHE_TIMEOUT = int(os.getenv("USER_STATE_CACHE_TIMEOUT", 300))
+
 # Celery
 CELERY_BROKER_URL = os.getenv("REDIS_HOST", "redis://localhost:6379/0")
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
+CELERY_BEAT_SCHEDULE = {
+    "dispatch-notification-outbox": {
+        "task": "notifications.tasks.dispatch_outbox_task",
+        "schedule": float(os.getenv("NOTIFICATION_OUTBOX_INTERVAL", 5)),
+    },
+    "send-borrowing-reminders": {
+        "task": "borrowings.tasks.send_due_reminders_task",
+        "schedule": float(os.getenv("BORROWING_REMINDER_INTERVAL", 3600)),
+    },
+    "update-circulation-rollups": {
+        "task": "borrowings.tasks.update_circulation_rollups_task",
+        "schedule": float(os.getenv("CIRCULATION_ROLLUP_INTERVAL", 60)),
+    },
+    "compact-inventory-shards": {
+        "task": "books.tasks.compact_inventory_shards_task",
+        "schedule": float(os.getenv("INVENTORY_COMPACT_INTERVAL", 60)),
+    },
+    "recompute-fines": {
+        "task": "borrowings.tasks.recompute_fines_task",
+        "schedule": crontab(hour=2, minute=0),
+    },
+    "archive-returned-borrowings": {
+        "task": "borrowings.tasks.archive_borrowings_task",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "purge-notification-outbox": {
+        "task": "notifications.tasks.purge_outbox_task",
+        "schedule": crontab(hour=4, minute=0),
+    },
+}
+
+# Remind borrowers this many days before the expected return date.
+BORROWING_REMINDER_DAYS = int(os.getenv("BORROWING_REMINDER_DAYS", 1))
+BORROWING_REMINDER_BATCH_SIZE = int(
+    os.getenv("BORROWING_REMINDER_BATCH_SIZE", 500)
+)
+CIRCULATION_ROLLUP_BATCH_SIZE = int(
+    os.getenv("CIRCULATION_ROLLUP_BATCH_SIZE", 5000)
+)
+# Borrowings per UPDATE in the nightly fine recompute.
+FINE_RECOMPUTE_CHUNK_SIZE = int(os.getenv("FINE_RECOMPUTE_CHUNK_SIZE", 50000))
+# Returned borrowings older than this move to the archive table nightly.
+BORROWING_ARCHIVE_AFTER_DAYS = int(
+    os.getenv("BORROWING_ARCHIVE_AFTER_DAYS", 365)
+)
+BORROWING_ARCHIVE_BATCH_SIZE = int(
+    os.getenv("BORROWING_ARCHIVE_BATCH_SIZE", 1000)
+)
 
 # Telegram bot
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# Delivery engine limits, Telegram allows about 30 messages/s per bot and
+# 1 message/s per chat.
+TELEGRAM_CONCURRENCY = int(os.getenv("TELEGRAM_CONCURRENCY", 10))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+# Notifications are delivered from an outbox table by a periodic
+# dispatcher. TELEGRAM_DIGEST_WINDOW is the number of seconds to collect
+# events into one digest message, 0 sends every event on its own.
+NOTIFICATION_OUTBOX_BATCH_SIZE = int(
+    os.getenv("NOTIFICATION_OUTBOX_BATCH_SIZE", 100)
+)
+TELEGRAM_DIGEST_WINDOW = int(os.getenv("TELEGRAM_DIGEST_WINDOW", 0))
+TELEGRAM_DIGEST_MAX_SIZE = int(os.getenv("TELEGRAM_DIGEST_MAX_SIZE", 50))
+# Delivered outbox rows older than this are deleted nightly.
+NOTIFICATION_OUTBOX_RETENTION_DAYS = int(
+    os.getenv("NOTIFICATION_OUTBOX_RETENTION_DAYS", 7)
+)
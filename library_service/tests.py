@@ -0,0 +1,246 @@
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse, set_urlconf
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from books.models import Book
+from library_service.asgi import AsyncRoutesHandler
+from library_service.database import (
+    connection_stats,
+    postgres_database,
+    replica_databases,
+)
+from library_service.replicas import (
+    PrimaryReplicaRouter,
+    pin_key,
+    primary_reads,
+    replica_lag,
+    replica_routing_middleware,
+)
+
+POSTGRES_ENV = {
+    "POSTGRES_DB": "library",
+    "POSTGRES_USER": "library",
+    "POSTGRES_PASSWORD": "secret",
+    "POSTGRES_HOST": "db",
+    "POSTGRES_PORT": "5432",
+}
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def test_persistent_connections_by_default(self):
+        database = postgres_database(POSTGRES_ENV)
+        self.assertEqual(database["CONN_MAX_AGE"], 60)
+        self.assertTrue(database["CONN_HEALTH_CHECKS"])
+        self.assertNotIn("OPTIONS", database)
+
+    def test_pool_is_sized_against_every_pooling_process(self):
+        for env, min_size, max_size in (
+            # 2 web processes, 1 uvicorn worker, 1 Celery child and beat.
+            ({}, 2, 16),
+            (
+                {"WEB_CONCURRENCY": "4", "DATABASE_MAX_CONNECTIONS": "90"},
+                2,
+                12,
+            ),
+            (
+                {
+                    "WEB_CONCURRENCY": "4",
+                    "ASGI_CONCURRENCY": "2",
+                    "CELERY_CONCURRENCY": "8",
+                },
+                2,
+                5,
+            ),
+            ({"WEB_CONCURRENCY": "64"}, 2, 2),
+            (
+                {"DATABASE_POOL_MIN_SIZE": "5", "DATABASE_POOL_MAX_SIZE": "8"},
+                5,
+                8,
+            ),
+        ):
+            with self.subTest(env=env):
+                database = postgres_database(
+                    {**POSTGRES_ENV, "DATABASE_POOL": "1", **env}
+                )
+                pool = database["OPTIONS"]["pool"]
+                self.assertEqual(database["CONN_MAX_AGE"], 0)
+                self.assertEqual(pool["min_size"], min_size)
+                self.assertEqual(pool["max_size"], max_size)
+
+    def test_pool_stats_report_waiters_and_checkout_latency(self):
+        counters = {
+            "pool_min": 2,
+            "pool_max": 10,
+            "pool_size": 10,
+            "pool_available": 0,
+            "requests_waiting": 3,
+            "requests_num": 200,
+            "requests_queued": 20,
+            "requests_wait_ms": 500,
+            "connections_num": 10,
+            "connections_ms": 40,
+        }
+        connection = SimpleNamespace(
+            alias="default",
+            vendor="postgresql",
+            settings_dict={"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": True},
+            pool=SimpleNamespace(get_stats=lambda: counters),
+        )
+        stats = connection_stats(connection)
+        self.assertTrue(stats["pooled"])
+        self.assertEqual(stats["waiting"], 3)
+        self.assertEqual(stats["checkout_wait_ms_avg"], 2.5)
+        self.assertEqual(stats["connect_ms_avg"], 4)
+        self.assertEqual(stats["checkout_errors"], 0)
+
+    def test_replicas_are_cloned_from_the_primary(self):
+        primary = postgres_database(POSTGRES_ENV)
+        replicas = replica_databases(
+            primary, {"POSTGRES_REPLICA_HOSTS": "standby-a, standby-b:6432"}
+        )
+        self.assertEqual(list(replicas), ["replica_1", "replica_2"])
+        self.assertEqual(replicas["replica_1"]["HOST"], "standby-a")
+        self.assertEqual(replicas["replica_1"]["PORT"], "5432")
+        self.assertEqual(replicas["replica_2"]["PORT"], "6432")
+        self.assertEqual(replicas["replica_2"]["NAME"], "library")
+        self.assertEqual(replicas["replica_2"]["TEST"], {"MIRROR": "default"})
+
+        sqlite = {"ENGINE": "django.db.backends.sqlite3", "NAME": "db"}
+        replicas = replica_databases(sqlite, {"SQLITE_REPLICAS": "copy.db"})
+        self.assertEqual(replicas["replica_1"]["NAME"], "copy.db")
+        self.assertEqual(replica_databases(sqlite, {}), {})
+
+    def test_sqlite_replica_lag_is_the_age_of_the_copy(self):
+        with tempfile.NamedTemporaryFile() as copy:
+            copied_at = time.time() - 30
+            os.utime(copy.name, (copied_at, copied_at))
+            connection = SimpleNamespace(
+                vendor="sqlite", settings_dict={"NAME": copy.name}
+            )
+            lag = replica_lag(connection)
+        self.assertAlmostEqual(lag, 30, delta=5)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.routed_to = []
+        for user_id in (1, 2):
+            cache.delete(pin_key(user_id))
+
+    def get_response(self, request):
+        self.routed_to.append(PrimaryReplicaRouter().db_for_read(Book))
+        with primary_reads():
+            self.routed_to.append(PrimaryReplicaRouter().db_for_read(Book))
+        return HttpResponse(status=getattr(request, "status", 200))
+
+    def request(self, method, path, user_id=None, status=200):
+        headers = {}
+        if user_id is not None:
+            token = AccessToken()
+            token["user_id"] = user_id
+            headers["Authorization"] = f"Bearer {token}"
+        request = self.factory.generic(method, path, headers=headers)
+        request.status = status
+        self.routed_to.clear()
+        self.middleware(request)
+        return self.routed_to
+
+    def check_routing(self):
+        self.assertEqual(
+            self.request("GET", "/api/books/"), ["replica_1", "default"]
+        )
+        self.assertEqual(self.request("GET", "/admin/")[0], "default")
+
+        # A failed write does not pin, a successful one does.
+        self.assertEqual(
+            self.request("POST", "/api/borrowings/", 1, status=400)[0],
+            "default",
+        )
+        self.assertEqual(
+            self.request("GET", "/api/borrowings/", 1)[0], "replica_1"
+        )
+        self.request("POST", "/api/borrowings/", 1, status=201)
+        self.assertEqual(
+            self.request("GET", "/api/borrowings/", 1)[0], "default"
+        )
+        self.assertEqual(
+            self.request("GET", "/api/borrowings/", 2)[0], "replica_1"
+        )
+
+    def test_sync_requests(self):
+        self.middleware = replica_routing_middleware(self.get_response)
+        self.check_routing()
+
+    def test_async_requests(self):
+        async def get_response(request):
+            return self.get_response(request)
+
+        self.middleware = async_to_sync(
+            replica_routing_middleware(get_response)
+        )
+        self.check_routing()
+
+    def test_writes_and_migrations_stay_on_the_primary(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Book), "default")
+        self.assertEqual(router.db_for_write(Book), "default")
+        self.assertFalse(router.allow_migrate("replica_1", "books"))
+        self.assertTrue(router.allow_migrate("default", "books"))
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.middleware = replica_routing_middleware(self.get_response)
+            self.assertEqual(
+                self.request("GET", "/api/books/")[0], "default"
+            )
+
+
+class DatabaseStatsViewTests(TestCase):
+    def test_stats_are_staff_only(self):
+        url = reverse("database-stats")
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        client = APIClient()
+        client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="admin@admin.com", password="<PASSWORD>", is_staff=True
+            )
+        )
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        default = response.json()["databases"][0]
+        self.assertEqual(default["alias"], "default")
+        self.assertFalse(default["pooled"])
+
+
+class AsyncRoutesHandlerTests(TestCase):
+    def test_only_async_routes_are_served(self):
+        handler = AsyncRoutesHandler()
+        factory = AsyncRequestFactory()
+        # Reset by request_finished, which this test does not send.
+        self.addCleanup(set_urlconf, None)
+
+        def get(path):
+            return async_to_sync(handler.get_response_async)(
+                factory.get(path)
+            ).status_code
+
+        self.assertEqual(get("/api/async/books/"), 200)
+        self.assertEqual(get("/api/books/"), 404)
+        self.assertEqual(get("/api/borrowings/export/"), 404)
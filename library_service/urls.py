@@ -24,6 +24,8 @@ from drf_spectacular.views import (
     SpectacularRedocView,
 )
 
+from library_service.views import DatabaseStatsView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/books/", include("books.urls", namespace="books")),
@@ -32,6 +34,19 @@ urlpatterns = [
         include("borrowings.urls", namespace="borrowings"),
     ),
     path("api/users/", include("users.urls", namespace="users")),
+    path(
+        "api/async/books/",
+        include("books.async_urls", namespace="async-books"),
+    ),
+    path(
+        "api/async/borrowings/",
+        include("borrowings.async_urls", namespace="async-borrowings"),
+    ),
+    path(
+        "api/database-stats/",
+        DatabaseStatsView.as_view(),
+        name="database-stats",
+    ),
     path("api/doc/", SpectacularAPIView.as_view(), name="schema"),
     path(
         "api/doc/swagger/",
@@ -0,0 +1,38 @@
+import os
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from library_service.database import connection_stats
+from library_service.replicas import replica_lag
+
+
+class DatabaseStatsView(APIView):
+    """(Admin only) Connection reuse and pool counters of the process
+    that serves the request; every worker process has its own pool.
+    Replicas also report their lag behind the primary in seconds.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(
+            {
+                "pid": os.getpid(),
+                "databases": [
+                    self.get_stats(connection)
+                    for connection in connections.all()
+                ],
+            }
+        )
+
+    @staticmethod
+    def get_stats(connection):
+        stats = connection_stats(connection)
+        stats["replica"] = connection.alias in settings.DATABASE_REPLICAS
+        if stats["replica"]:
+            stats["lag_seconds"] = replica_lag(connection)
+        return stats
@@ -0,0 +1,72 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.stub_server import StubTelegramServer
+from notifications.telegram import TelegramSender
+
+
+class Command(BaseCommand):
+    help = (
+        "Push messages through the Telegram delivery engine against a "
+        "local stub server and report the messages/sec achieved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=300)
+        parser.add_argument("--chats", type=int, default=30)
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--global-rate", type=float, default=30)
+        parser.add_argument("--chat-rate", type=float, default=1)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Seconds the stub server waits before answering.",
+        )
+        parser.add_argument(
+            "--errors",
+            type=int,
+            default=0,
+            help="Answer this many requests with 429 and as many with 500.",
+        )
+
+    def handle(self, *args, **options):
+        messages = options["messages"]
+        failures = [429, 500] * options["errors"]
+
+        with StubTelegramServer(
+            failures=failures, latency=options["latency"]
+        ) as server:
+            sender = TelegramSender(
+                "benchmark",
+                base_url=server.url,
+                concurrency=options["concurrency"],
+                global_rate=options["global_rate"],
+                chat_rate=options["chat_rate"],
+                backoff=0.05,
+            )
+            results = asyncio.run(self.run(sender, messages, options["chats"]))
+            requests = len(server.requests)
+
+        stats = sender.stats
+        self.stdout.write(
+            f"messages: {messages}  sent: {stats.sent}  "
+            f"failed: {stats.failed}  retries: {stats.retries}  "
+            f"requests: {requests}"
+        )
+        self.stdout.write(
+            f"elapsed: {stats.elapsed:.2f}s  "
+            f"throughput: {stats.messages_per_second:.1f} messages/s"
+        )
+        if not all(results):
+            raise CommandError(f"{stats.failed} messages were not delivered.")
+
+    async def run(self, sender, messages, chats):
+        async with sender:
+            return await asyncio.gather(
+                *(
+                    sender.send(f"chat-{i % chats}", f"<b>Message {i}</b>")
+                    for i in range(messages)
+                )
+            )
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0002_outbox_message"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="outboxmessage",
+            name="outbox_pending_idx",
+        ),
+        migrations.AddField(
+            model_name="outboxmessage",
+            name="failed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="outboxmessage",
+            index=models.Index(
+                condition=models.Q(
+                    ("delivered_at__isnull", True), ("failed_at__isnull", True)
+                ),
+                fields=["id"],
+                name="outbox_pending_idx",
+            ),
+        ),
+    ]
@@ -1,3 +1,35 @@
 from django.db import models
 
-# Create your models here.
+
+class OutboxMessageQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(delivered_at__isnull=True, failed_at__isnull=True)
+
+
+class OutboxMessage(models.Model):
+    """A Telegram notification written in the same transaction as the
+    change it announces and delivered later by the outbox dispatcher.
+    """
+
+    text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # A dispatcher owns the row until then; expired claims are retried.
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    # Set once every attempt failed; such rows are never retried.
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OutboxMessageQuerySet.as_manager()
+
+    class Meta:
+        ordering = ("id",)
+        indexes = [
+            models.Index(
+                fields=["id"],
+                name="outbox_pending_idx",
+                condition=models.Q(
+                    delivered_at__isnull=True, failed_at__isnull=True
+                ),
+            ),
+        ]
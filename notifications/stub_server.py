@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class StubTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this every
+    # keep-alive request stalls on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        payload = {
+            key: values[0]
+            for key, values in parse_qs(self.rfile.read(length).decode())
+            .items()
+        }
+        if server.latency:
+            time.sleep(server.latency)
+
+        with server.lock:
+            server.requests.append((self.path, payload))
+            status = server.failures.pop(0) if server.failures else 200
+
+        if status == 200:
+            body = {"ok": True, "result": {"text": payload.get("text")}}
+        elif status == 429:
+            body = {
+                "ok": False,
+                "error_code": 429,
+                "parameters": {"retry_after": server.retry_after},
+            }
+        else:
+            body = {"ok": False, "error_code": status}
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubTelegramServer(ThreadingHTTPServer):
+    """Local stand-in for the Telegram Bot API's ``sendMessage``.
+
+    Records every request and answers 200, except for the status codes
+    queued in ``failures``, which are returned first in order. Use it as
+    a context manager; ``url`` is the base URL to hand to the sender.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, failures=(), latency=0.0, retry_after=0.01):
+        super().__init__(("127.0.0.1", 0), StubTelegramHandler)
+        self.failures = list(failures)
+        self.latency = latency
+        self.retry_after = retry_after
+        self.requests = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
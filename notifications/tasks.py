@@ -1,25 +1,280 @@
+import asyncio
+import datetime
+import logging
+import uuid
+
 from celery import shared_task
-import requests
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from notifications.models import OutboxMessage
+from notifications.telegram import TelegramSender
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects messages longer than 4096 characters.
+TELEGRAM_MESSAGE_LIMIT = 4096
+# How long a dispatcher may hold claimed rows before others retry them.
+OUTBOX_CLAIM_TIMEOUT = datetime.timedelta(minutes=1)
+OUTBOX_MAX_ATTEMPTS = 5
+# Held by the one dispatcher allowed to send at a time, so the rate
+# limits of its sender are the limits of the whole deployment.
+OUTBOX_LOCK_KEY = "notifications:outbox:dispatcher"
+# Delivered rows deleted per statement by the retention task.
+OUTBOX_PURGE_BATCH_SIZE = 1000
+
+
+def telegram_configured():
+    if settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_CHAT_ID:
+        return True
+    logger.warning("Telegram bot token or chat ID is not configured.")
+    return False
+
+
+def telegram_sender():
+    return TelegramSender(
+        settings.TELEGRAM_BOT_TOKEN,
+        base_url=settings.TELEGRAM_API_URL,
+        concurrency=settings.TELEGRAM_CONCURRENCY,
+        global_rate=settings.TELEGRAM_GLOBAL_RATE,
+        chat_rate=settings.TELEGRAM_CHAT_RATE,
+    )
+
+
+def notify(text: str):
+    """Queue a Telegram notification in the outbox.
+
+    The row is part of the caller's transaction, so nothing is sent for
+    changes that roll back and the request never waits on the broker.
+    """
+    OutboxMessage.objects.create(text=text)
+
+
+def notify_many(texts):
+    """Queue several notifications with a single INSERT."""
+    OutboxMessage.objects.bulk_create(
+        OutboxMessage(text=text) for text in texts
+    )
+
+
+def build_digest(batch):
+    """Join the texts of buffered ``(id, text)`` rows into as few Telegram
+    messages as possible. Returns ``(message, ids)`` pairs, the ids being
+    the rows each message carries.
+    """
+    header = f"📬 <b>Borrowing digest ({len(batch)} events)</b>"
+    messages = [(header, [])]
+    for pk, text in batch:
+        message, ids = messages[-1]
+        candidate = f"{message}\n\n{text}"
+        if len(candidate) <= TELEGRAM_MESSAGE_LIMIT:
+            messages[-1] = (candidate, ids + [pk])
+        else:
+            messages.append((text[:TELEGRAM_MESSAGE_LIMIT], [pk]))
+    return messages
+
+
+def fail_exhausted(queryset):
+    """Mark the rows of ``queryset`` that used up their attempts as
+    failed, so they stop counting as pending. Returns how many.
+    """
+    ids = list(
+        queryset.filter(attempts__gte=OUTBOX_MAX_ATTEMPTS).values_list(
+            "id", flat=True
+        )
+    )
+    if ids:
+        OutboxMessage.objects.filter(id__in=ids).update(
+            failed_at=timezone.now()
+        )
+        logger.error(
+            "Outbox gave up on messages %s after %d attempts.",
+            ids,
+            OUTBOX_MAX_ATTEMPTS,
+        )
+    return len(ids)
+
+
+def claim_outbox_batch(batch_size):
+    """Claim up to ``batch_size`` pending rows for this dispatcher.
+
+    Rows locked or claimed by another dispatcher are skipped. Only one
+    dispatcher normally runs (see ``dispatch_outbox_task``); the claim
+    still keeps a row from going out twice if a second one slips past
+    the lock, or when a crashed run's rows are retried.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects.pending()
+            .filter(
+                Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+                attempts__lt=OUTBOX_MAX_ATTEMPTS,
+            )
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)[:batch_size]
+        )
+        OutboxMessage.objects.filter(id__in=ids).update(
+            claimed_until=now + OUTBOX_CLAIM_TIMEOUT,
+            attempts=F("attempts") + 1,
+        )
+    return list(
+        OutboxMessage.objects.filter(id__in=ids).values_list("id", "text")
+    )
+
+
+def digest_due(window, max_size):
+    """Whether the oldest pending event has waited a full window or
+    enough events have piled up to fill a digest.
+    """
+    pending = OutboxMessage.objects.pending().filter(
+        attempts__lt=OUTBOX_MAX_ATTEMPTS
+    )
+    oldest = pending.values_list("created_at", flat=True).first()
+    if oldest is None:
+        return False
+    if oldest <= timezone.now() - datetime.timedelta(seconds=window):
+        return True
+    return pending[:max_size].count() >= max_size
+
+
+def outbox_batch_size():
+    """Rows to claim per batch.
+
+    Every row goes to the one configured chat, so a batch of single
+    messages takes ``size / TELEGRAM_CHAT_RATE`` seconds to send. It is
+    capped to fit in half the claim timeout, leaving room for retries,
+    so no claim expires while its rows are still being sent.
+    """
+    if settings.TELEGRAM_DIGEST_WINDOW:
+        # A digest batch goes out as one or a few combined messages.
+        return settings.TELEGRAM_DIGEST_MAX_SIZE
+    sendable = int(
+        OUTBOX_CLAIM_TIMEOUT.total_seconds() / 2 * settings.TELEGRAM_CHAT_RATE
+    )
+    return max(1, min(settings.NOTIFICATION_OUTBOX_BATCH_SIZE, sendable))
 
 
 @shared_task
-def send_telegram_message_task(text: str):
-    token = settings.TELEGRAM_BOT_TOKEN
-    chat_id = settings.TELEGRAM_CHAT_ID
+def purge_outbox_task():
+    """Delete rows delivered more than ``NOTIFICATION_OUTBOX_RETENTION_DAYS``
+    days ago, return how many went.
+
+    Deletes in batches, so each statement holds its locks briefly.
+    """
+    cutoff = timezone.now() - datetime.timedelta(
+        days=settings.NOTIFICATION_OUTBOX_RETENTION_DAYS
+    )
+    expired = OutboxMessage.objects.filter(delivered_at__lt=cutoff)
+    purged = 0
+    while ids := list(
+        expired.values_list("id", flat=True)[:OUTBOX_PURGE_BATCH_SIZE]
+    ):
+        purged += OutboxMessage.objects.filter(id__in=ids).delete()[0]
+    return purged
+
 
-    if not token or not chat_id:
-        print("[Telegram] Missing token or chat ID.")
-        return
+@shared_task
+def dispatch_outbox_task():
+    """Deliver pending outbox rows batch by batch, return how many went.
+
+    With ``TELEGRAM_DIGEST_WINDOW`` set, rows wait until the window has
+    passed or ``TELEGRAM_DIGEST_MAX_SIZE`` of them have piled up, and each
+    batch goes out as one combined message.
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML",
-    }
+    Only one dispatcher runs at a time: overlapping runs queued by beat
+    return straight away instead of sending past Telegram's limits.
+    Every row goes to the one configured chat, whose rate limit caps
+    delivery whatever the number of dispatchers, while each dispatcher
+    would bring its own rate limiter. The lock lives in the cache, so it
+    covers the deployment only with the shared ``REDIS_CACHE_URL`` cache;
+    on the local-memory fallback it holds per worker process.
+    """
+    if not telegram_configured():
+        return 0
 
+    lock_timeout = OUTBOX_CLAIM_TIMEOUT.total_seconds()
+    token = uuid.uuid4().hex
+    if not cache.add(OUTBOX_LOCK_KEY, token, timeout=lock_timeout):
+        logger.info("Outbox run skipped, another dispatcher is running.")
+        return 0
     try:
-        requests.post(url, data=payload, timeout=5)
-    except requests.RequestException as e:
-        print(f"[Telegram] Failed to send message: {e}")
+        return dispatch_outbox(lock_timeout)
+    finally:
+        if cache.get(OUTBOX_LOCK_KEY) == token:
+            cache.delete(OUTBOX_LOCK_KEY)
+
+
+def dispatch_outbox(lock_timeout):
+    window = settings.TELEGRAM_DIGEST_WINDOW
+    batch_size = outbox_batch_size()
+    chat_id = settings.TELEGRAM_CHAT_ID
+    sender = telegram_sender()
+    delivered = 0
+    # Rows whose last attempt's claim ran out, e.g. after a crash.
+    fail_exhausted(
+        OutboxMessage.objects.pending().filter(
+            claimed_until__lt=timezone.now()
+        )
+    )
+
+    # One event loop and one keep-alive client for the whole run; the
+    # database work in between stays synchronous.
+    with asyncio.Runner() as runner:
+        runner.run(sender.open())
+        try:
+            while not window or digest_due(window, batch_size):
+                # Each batch fits in the lock, renewed before claiming.
+                cache.touch(OUTBOX_LOCK_KEY, lock_timeout)
+                batch = claim_outbox_batch(batch_size)
+                if not batch:
+                    break
+
+                if window:
+                    messages = build_digest(batch)
+                    sent = runner.run(
+                        sender.send_in_order(
+                            chat_id, [message for message, _ in messages]
+                        )
+                    )
+                    # Rows of the messages that went out are delivered
+                    # even when a later one failed.
+                    delivered_ids = [
+                        pk for _, ids in messages[:sent] for pk in ids
+                    ]
+                else:
+                    results = runner.run(
+                        sender.send_many(chat_id, [text for _, text in batch])
+                    )
+                    delivered_ids = [
+                        pk for (pk, _), sent in zip(batch, results) if sent
+                    ]
+
+                OutboxMessage.objects.filter(id__in=delivered_ids).update(
+                    delivered_at=timezone.now()
+                )
+                fail_exhausted(
+                    OutboxMessage.objects.filter(
+                        id__in=[pk for pk, _ in batch]
+                    ).exclude(id__in=delivered_ids)
+                )
+                delivered += len(delivered_ids)
+                if len(delivered_ids) < batch_size:
+                    # Drained, or Telegram is failing: leave the rest to
+                    # the next run.
+                    break
+        finally:
+            runner.run(sender.close())
+
+    stats = sender.stats
+    logger.info(
+        "Outbox run: %d delivered, %d failed, %d retries, %.1f messages/s.",
+        delivered,
+        stats.failed,
+        stats.retries,
+        stats.messages_per_second,
+    )
+    return delivered
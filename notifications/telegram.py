@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+
+
+class TokenBucket:
+    """Allow ``rate`` acquisitions per second with bursts up to ``capacity``.
+
+    Waiters sleep just long enough for the next token instead of polling.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = self.clock()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate,
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class DeliveryStats:
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def messages_per_second(self):
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+class TelegramSender:
+    """Deliver Telegram messages over one keep-alive HTTP client.
+
+    At most ``concurrency`` requests are in flight. Every request takes a
+    token from the global bucket and from its chat's bucket, matching
+    Telegram's limits (about 30 messages/s overall and 1/s per chat).
+    429 responses wait for ``retry_after``; 5xx and transport errors are
+    retried with full-jitter exponential backoff.
+
+    Use it as an async context manager::
+
+        async with TelegramSender(token) as sender:
+            results = await sender.send_many(chat_id, texts)
+
+    or call ``open()`` and ``close()`` to keep the client across several
+    event loop runs.
+    """
+
+    def __init__(
+        self,
+        token,
+        base_url=TELEGRAM_API_URL,
+        concurrency=10,
+        global_rate=30,
+        chat_rate=1,
+        max_retries=5,
+        backoff=0.5,
+        timeout=5,
+    ):
+        self.token = token
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets = {}
+        self.stats = DeliveryStats()
+        self.client = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+        )
+        self.stats = DeliveryStats()
+        return self
+
+    async def close(self):
+        await self.client.aclose()
+        self.client = None
+
+    async def send_many(self, chat_id, texts):
+        """Send ``texts`` concurrently, return a success flag per text."""
+        return await asyncio.gather(
+            *(self.send(chat_id, text) for text in texts)
+        )
+
+    async def send_in_order(self, chat_id, texts):
+        """Send ``texts`` one after another, stop at the first failure.
+        Return how many were sent.
+        """
+        for sent, text in enumerate(texts):
+            if not await self.send(chat_id, text):
+                return sent
+        return len(texts)
+
+    async def send(self, chat_id, text):
+        """Send one HTML message, return whether Telegram accepted it."""
+        chat_bucket = self.chat_buckets.setdefault(
+            chat_id, TokenBucket(self.chat_rate)
+        )
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
+
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.global_bucket.acquire()
+                await chat_bucket.acquire()
+                try:
+                    response = await self.client.post(
+                        f"/bot{self.token}/sendMessage", data=payload
+                    )
+                except httpx.TransportError as error:
+                    logger.warning("Telegram request failed: %r", error)
+                    delay = self.backoff_delay(attempt)
+                else:
+                    if response.is_success:
+                        self.stats.sent += 1
+                        return True
+                    if response.status_code == 429:
+                        delay = self.retry_after(response, attempt)
+                    elif response.status_code >= 500:
+                        delay = self.backoff_delay(attempt)
+                    else:
+                        logger.error(
+                            "Telegram rejected a message: %s %s",
+                            response.status_code,
+                            response.text,
+                        )
+                        break
+
+                if attempt < self.max_retries:
+                    self.stats.retries += 1
+                    await asyncio.sleep(delay)
+
+        self.stats.failed += 1
+        return False
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def retry_after(self, response, attempt):
+        try:
+            return float(response.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            pass
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return self.backoff_delay(attempt)
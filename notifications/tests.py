@@ -1,3 +1,248 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import time
+from unittest.mock import AsyncMock, patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from notifications.models import OutboxMessage
+from notifications.stub_server import StubTelegramServer
+from notifications.tasks import (
+    build_digest,
+    claim_outbox_batch,
+    dispatch_outbox_task,
+    notify,
+    outbox_batch_size,
+    OUTBOX_LOCK_KEY,
+    OUTBOX_MAX_ATTEMPTS,
+    purge_outbox_task,
+    TELEGRAM_MESSAGE_LIMIT,
+)
+from notifications.telegram import TelegramSender, TokenBucket
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="token", TELEGRAM_CHAT_ID="42")
+@patch(
+    "notifications.telegram.TelegramSender.send",
+    new_callable=AsyncMock,
+    return_value=True,
+)
+class OutboxTests(TestCase):
+    def test_notify_is_rolled_back_with_the_transaction(self, mock_send):
+        notify("📚 <b>Kept</b>")
+        try:
+            with transaction.atomic():
+                notify("📚 <b>Rolled back</b>")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(
+            list(OutboxMessage.objects.values_list("text", flat=True)),
+            ["📚 <b>Kept</b>"],
+        )
+        mock_send.assert_not_called()
+
+    @override_settings(NOTIFICATION_OUTBOX_BATCH_SIZE=2)
+    def test_dispatcher_delivers_every_row_once(self, mock_send):
+        for text in ("<b>One</b>", "<b>Two</b>", "<b>Three</b>"):
+            notify(text)
+
+        self.assertEqual(dispatch_outbox_task(), 3)
+        self.assertEqual(dispatch_outbox_task(), 0)
+
+        self.assertEqual(
+            [call.args for call in mock_send.call_args_list],
+            [
+                ("42", "<b>One</b>"),
+                ("42", "<b>Two</b>"),
+                ("42", "<b>Three</b>"),
+            ],
+        )
+        self.assertFalse(OutboxMessage.objects.pending().exists())
+
+    def test_claimed_rows_are_skipped_until_the_claim_expires(
+        self, mock_send
+    ):
+        notify("<b>One</b>")
+        notify("<b>Two</b>")
+
+        first = claim_outbox_batch(1)
+        second = claim_outbox_batch(10)
+        self.assertEqual(len(first), 1)
+        self.assertEqual([pk for pk, _ in second], [first[-1][0] + 1])
+        self.assertEqual(claim_outbox_batch(10), [])
+
+        OutboxMessage.objects.update(
+            claimed_until=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        self.assertEqual(len(claim_outbox_batch(10)), 2)
+
+    @override_settings(
+        NOTIFICATION_OUTBOX_BATCH_SIZE=100, TELEGRAM_CHAT_RATE=1
+    )
+    def test_one_dispatcher_sends_batches_that_fit_the_claim(self, mock_send):
+        # 1 message/s for half of the 60 s claim.
+        self.assertEqual(outbox_batch_size(), 30)
+
+        notify("<b>One</b>")
+        cache.add(OUTBOX_LOCK_KEY, "other", timeout=60)
+        try:
+            self.assertEqual(dispatch_outbox_task(), 0)
+        finally:
+            cache.delete(OUTBOX_LOCK_KEY)
+        mock_send.assert_not_called()
+        self.assertEqual(OutboxMessage.objects.get().attempts, 0)
+
+        self.assertEqual(dispatch_outbox_task(), 1)
+        self.assertIsNone(cache.get(OUTBOX_LOCK_KEY))
+
+    def test_failed_rows_stay_pending_for_a_retry(self, mock_send):
+        mock_send.return_value = False
+        notify("<b>One</b>")
+
+        self.assertEqual(dispatch_outbox_task(), 0)
+        message = OutboxMessage.objects.get()
+        self.assertIsNone(message.delivered_at)
+        self.assertEqual(message.attempts, 1)
+
+    def test_rows_out_of_attempts_are_marked_failed(self, mock_send):
+        mock_send.return_value = False
+        notify("<b>One</b>")
+        OutboxMessage.objects.update(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+
+        with self.assertLogs("notifications.tasks", "ERROR"):
+            self.assertEqual(dispatch_outbox_task(), 0)
+        message = OutboxMessage.objects.get()
+        self.assertIsNotNone(message.failed_at)
+        self.assertFalse(OutboxMessage.objects.pending().exists())
+
+    @override_settings(TELEGRAM_DIGEST_WINDOW=60, TELEGRAM_DIGEST_MAX_SIZE=3)
+    def test_digest_waits_for_the_window_or_the_size_limit(self, mock_send):
+        notify("<b>One</b>")
+        notify("<b>Two</b>")
+        self.assertEqual(dispatch_outbox_task(), 0)
+
+        notify("<b>Three</b>")
+        self.assertEqual(dispatch_outbox_task(), 3)
+        mock_send.assert_called_once()
+        self.assertIn(
+            "<b>One</b>\n\n<b>Two</b>\n\n<b>Three</b>",
+            mock_send.call_args.args[1],
+        )
+
+        notify("<b>Four</b>")
+        self.assertEqual(dispatch_outbox_task(), 0)
+        OutboxMessage.objects.pending().update(
+            created_at=timezone.now() - datetime.timedelta(minutes=2)
+        )
+        self.assertEqual(dispatch_outbox_task(), 1)
+
+    @override_settings(NOTIFICATION_OUTBOX_RETENTION_DAYS=7)
+    def test_purge_deletes_only_long_delivered_rows(self, mock_send):
+        now = timezone.now()
+        OutboxMessage.objects.bulk_create(
+            [
+                OutboxMessage(
+                    text="old", delivered_at=now - datetime.timedelta(days=8)
+                ),
+                OutboxMessage(
+                    text="recent",
+                    delivered_at=now - datetime.timedelta(days=6),
+                ),
+                OutboxMessage(text="pending"),
+            ]
+        )
+
+        self.assertEqual(purge_outbox_task(), 1)
+        self.assertEqual(
+            sorted(OutboxMessage.objects.values_list("text", flat=True)),
+            ["pending", "recent"],
+        )
+
+    def test_digest_splits_at_the_telegram_limit(self, mock_send):
+        messages = build_digest([(1, "x" * 3000), (2, "y" * 3000)])
+        self.assertEqual([ids for _, ids in messages], [[1], [2]])
+        self.assertTrue(
+            all(
+                len(message) <= TELEGRAM_MESSAGE_LIMIT
+                for message, _ in messages
+            )
+        )
+
+    @override_settings(TELEGRAM_DIGEST_WINDOW=60, TELEGRAM_DIGEST_MAX_SIZE=2)
+    def test_digest_delivers_the_rows_of_the_messages_sent(self, mock_send):
+        mock_send.side_effect = [True, False]
+        notify("x" * 3000)
+        notify("y" * 3000)
+
+        self.assertEqual(dispatch_outbox_task(), 1)
+        self.assertEqual(
+            list(
+                OutboxMessage.objects.pending().values_list("text", flat=True)
+            ),
+            ["y" * 3000],
+        )
+
+
+class TelegramSenderTests(TestCase):
+    def send(self, server, texts, **kwargs):
+        async def run():
+            async with TelegramSender(
+                "token",
+                base_url=server.url,
+                global_rate=1000,
+                chat_rate=1000,
+                backoff=0.01,
+                **kwargs,
+            ) as sender:
+                return sender, await sender.send_many("42", texts)
+
+        return asyncio.run(run())
+
+    def test_retries_rate_limits_and_server_errors(self):
+        with StubTelegramServer(failures=[429, 500, 502]) as server:
+            sender, results = self.send(server, ["<b>One</b>", "<b>Two</b>"])
+
+        self.assertEqual(results, [True, True])
+        self.assertEqual(len(server.requests), 5)
+        self.assertEqual(sender.stats.retries, 3)
+        self.assertEqual(
+            {path for path, _ in server.requests}, {"/bottoken/sendMessage"}
+        )
+        self.assertEqual(
+            {
+                (payload["chat_id"], payload["text"], payload["parse_mode"])
+                for _, payload in server.requests
+            },
+            {("42", "<b>One</b>", "HTML"), ("42", "<b>Two</b>", "HTML")},
+        )
+        self.assertGreater(sender.stats.messages_per_second, 0)
+
+    def test_gives_up_on_client_errors_and_after_max_retries(self):
+        with StubTelegramServer(failures=[400] + [500] * 3) as server:
+            with self.assertLogs("notifications.telegram", "ERROR"):
+                sender, results = self.send(
+                    server,
+                    ["<b>Bad</b>", "<b>Down</b>"],
+                    concurrency=1,
+                    max_retries=2,
+                )
+
+        self.assertEqual(results, [False, False])
+        self.assertEqual(len(server.requests), 4)
+        self.assertEqual(sender.stats.failed, 2)
+
+    def test_token_bucket_limits_the_rate(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+
+        async def acquire(times):
+            for _ in range(times):
+                await bucket.acquire()
+
+        started = time.monotonic()
+        asyncio.run(acquire(6))
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
@@ -0,0 +1,183 @@
+import functools
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import JsonResponse
+from django.utils.functional import empty, SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+STATE_FIELDS = ("email", "is_staff", "is_superuser", "is_active")
+
+
+def user_state_key(user_id):
+    return f"users:state:{user_id}"
+
+
+def get_user_state(user_id):
+    """Return the identity and role fields of a user, cached.
+
+    ``None`` means there is no such user. Entries are dropped whenever the
+    user is saved or deleted (see ``users.signals``).
+    """
+    key = user_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        state = (
+            # Always the primary, so a user created or deactivated a
+            # moment ago is not missed on a lagging replica.
+            get_user_model()
+            .objects.using(DEFAULT_DB_ALIAS)
+            .filter(pk=user_id)
+            .values(*STATE_FIELDS)
+            .first()
+        ) or {}
+        cache.set(key, state, settings.USER_STATE_CACHE_TIMEOUT)
+    return state or None
+
+
+async def aget_user_state(user_id):
+    """``get_user_state`` for async views."""
+    key = user_state_key(user_id)
+    state = await cache.aget(key)
+    if state is None:
+        state = (
+            await get_user_model()
+            .objects.using(DEFAULT_DB_ALIAS)
+            .filter(pk=user_id)
+            .values(*STATE_FIELDS)
+            .afirst()
+        ) or {}
+        await cache.aset(key, state, settings.USER_STATE_CACHE_TIMEOUT)
+    return state or None
+
+
+def invalidate_user_state(user_id):
+    cache.delete(user_state_key(user_id))
+
+
+def _state_property(name):
+    def getter(self):
+        if self._wrapped is empty:
+            return self._user_state[name]
+        return getattr(self._wrapped, name)
+
+    return property(getter)
+
+
+class CachedUser(SimpleLazyObject):
+    """Stand-in for ``request.user`` built from the cached user state.
+
+    Identity and role checks (``id``, ``email``, ``is_staff`` ...) are
+    answered without touching the database; any other attribute, or
+    passing it where a real ``User`` instance is required, loads the row.
+    """
+
+    def __init__(self, user_id, state):
+        super().__init__(lambda: get_user_model().objects.get(pk=user_id))
+        self.__dict__["_user_state"] = dict(state, id=user_id, pk=user_id)
+
+    id = _state_property("id")
+    pk = _state_property("pk")
+    email = _state_property("email")
+    is_staff = _state_property("is_staff")
+    is_superuser = _state_property("is_superuser")
+    is_active = _state_property("is_active")
+    is_authenticated = True
+    is_anonymous = False
+
+    def __bool__(self):
+        return True
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT authentication that does not load the user row per request.
+
+    The role comes from the cached user state rather than the token's own
+    claims, so revoking ``is_staff`` or deactivating a user takes effect
+    immediately instead of when the token expires.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        return self.make_user(user_id, get_user_state(user_id))
+
+    async def aauthenticate(self, request):
+        """``authenticate`` for async views, which cannot query the
+        database synchronously.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user_id = self.get_user_id(validated_token)
+        user = self.make_user(user_id, await aget_user_state(user_id))
+        return user, validated_token
+
+    @staticmethod
+    def get_user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed(
+                _("Token contained no recognizable user identification")
+            )
+
+    @staticmethod
+    def make_user(user_id, state):
+        if state is None:
+            raise AuthenticationFailed(
+                _("User not found"), code="user_not_found"
+            )
+        if not state["is_active"]:
+            raise AuthenticationFailed(
+                _("User is inactive"), code="user_inactive"
+            )
+        return CachedUser(user_id, state)
+
+
+def api_error_response(exc):
+    """JSON error body shaped like DRF's exception handler output."""
+    data = exc.detail if isinstance(exc.detail, dict) else {
+        "detail": exc.detail
+    }
+    return JsonResponse(data, status=exc.status_code)
+
+
+def jwt_required(view):
+    """Authenticate an async view with ``CachedJWTAuthentication``.
+
+    Sets ``request.user`` and ``request.auth`` or answers 401 like the
+    DRF views do.
+    """
+    authenticator = CachedJWTAuthentication()
+
+    @functools.wraps(view)
+    async def inner(request, *args, **kwargs):
+        try:
+            result = await authenticator.aauthenticate(request)
+            if result is None:
+                raise NotAuthenticated()
+        except APIException as exc:
+            response = api_error_response(exc)
+            response.status_code = status.HTTP_401_UNAUTHORIZED
+            response["WWW-Authenticate"] = authenticator.authenticate_header(
+                request
+            )
+            return response
+
+        request.user, request.auth = result
+        return await view(request, *args, **kwargs)
+
+    return inner
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import invalidate_user_state
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_state_on_change(sender, instance, **kwargs):
+    # Drop it again on commit, a concurrent request may have cached the
+    # old row in between.
+    invalidate_user_state(instance.pk)
+    transaction.on_commit(lambda: invalidate_user_state(instance.pk))
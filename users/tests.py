@@ -1,3 +1,77 @@
+import jwt
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from users.authentication import get_user_state
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="staff@staff.com", password="<PASSWORD>", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer "
+            + str(RefreshToken.for_user(self.user).access_token)
+        )
+        self.borrowings_url = reverse("borrowings:borrowing-list")
+
+    def test_warm_cache_authenticates_without_queries(self):
+        url = reverse("books:book-list")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_revoked_staff_role_applies_to_issued_tokens(self):
+        response = self.client.get(self.borrowings_url)
+        self.assertEqual(response.status_code, 200)
+
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.post(
+            reverse("borrowings:borrowing-bulk-return"),
+            {"borrowings": [1]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_deactivated_and_deleted_users_are_rejected(self):
+        get_user_state(self.user.id)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse("users:manage"))
+        self.assertEqual(response.status_code, 401)
+
+        self.user.delete()
+        response = self.client.get(reverse("users:manage"))
+        self.assertEqual(response.status_code, 401)
+
+    def test_manage_view_reads_and_updates_the_user(self):
+        response = self.client.get(reverse("users:manage"))
+        self.assertEqual(response.json()["email"], "staff@staff.com")
+
+        response = self.client.patch(
+            reverse("users:manage"),
+            {"email": "renamed@staff.com"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            get_user_state(self.user.id)["email"], "renamed@staff.com"
+        )
+
+    def test_obtained_token_carries_email_and_role(self):
+        response = self.client.post(
+            reverse("users:token_obtain_pair"),
+            {"email": "staff@staff.com", "password": "<PASSWORD>"},
+        )
+        claims = jwt.decode(
+            response.json()["access"], options={"verify_signature": False}
+        )
+        self.assertEqual(claims["email"], "staff@staff.com")
+        self.assertTrue(claims["is_staff"])